@@ -1,2 +1,2 @@
-from django_filters.filterset import FilterSet, DynamicFilterSet
+from django_filters.filterset import FilterSet, DynamicFilterSet, warmup
 from django_filters.filters import *
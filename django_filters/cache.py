@@ -0,0 +1,111 @@
+"""
+Cache helpers shared by the caching features of django-filter.
+
+Cached values are invalidated through per-model generation counters: every
+cache key built for a model includes its current generation, and saving or
+deleting an instance of a tracked model bumps the generation so the old keys
+are never read again.
+"""
+import hashlib
+import time
+
+from django.core.cache import get_cache
+from django.db import models
+from django.db.models import signals
+from django.db.models.query import QuerySet
+from django.db.models.sql.datastructures import EmptyResultSet
+
+KEY_PREFIX = 'django_filters'
+# generation counters should outlive the values they version
+GENERATION_TIMEOUT = 60 * 60 * 24 * 30
+
+_backends = {}
+
+def get_backend(alias='default'):
+    """
+    Returns the cache backend configured as ``alias`` in ``CACHES``.
+    """
+    try:
+        return _backends[alias]
+    except KeyError:
+        backend = _backends[alias] = get_cache(alias)
+        return backend
+
+def model_label(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.object_name.lower())
+
+def _generation_key(model):
+    return '%s:generation:%s' % (KEY_PREFIX, model_label(model))
+
+def get_generation(model, alias='default'):
+    """
+    Returns the current generation of ``model`` in the ``alias`` cache.
+    """
+    cache = get_backend(alias)
+    key = _generation_key(model)
+    generation = cache.get(key)
+    if generation is None:
+        # Start from the current time, so a counter that was evicted from the
+        # cache never goes back to a generation that is still in use.
+        generation = int(time.time() * 1000)
+        if not cache.add(key, generation, GENERATION_TIMEOUT):
+            generation = cache.get(key, generation)
+    return generation
+
+def bump_generation(model, alias='default'):
+    """
+    Invalidates every value cached for ``model`` in the ``alias`` cache.
+    """
+    cache = get_backend(alias)
+    try:
+        cache.incr(_generation_key(model))
+    except ValueError:
+        get_generation(model, alias)
+
+def track_model(model, alias='default'):
+    """
+    Bumps the generation of ``model`` whenever one of its instances is saved
+    or deleted.  Calling this more than once for a model has no effect.
+    """
+    def invalidate(sender, **kwargs):
+        bump_generation(model, alias)
+    dispatch_uid = '%s:%s:%s' % (KEY_PREFIX, alias, model_label(model))
+    signals.post_save.connect(invalidate, sender=model, weak=False,
+        dispatch_uid=dispatch_uid)
+    signals.post_delete.connect(invalidate, sender=model, weak=False,
+        dispatch_uid=dispatch_uid)
+
+def make_key(name, model, parts, alias='default'):
+    """
+    Returns the cache key for a value called ``name`` computed for ``model``
+    from ``parts``, which must have a stable ``repr()``.
+    """
+    digest = hashlib.md5(repr(parts)).hexdigest()
+    return '%s:%s:%s:%s:%s' % (KEY_PREFIX, name, model_label(model),
+        get_generation(model, alias), digest)
+
+def normalize(value):
+    """
+    Returns a representation of a cleaned form value with a stable ``repr()``
+    for use in cache keys: model instances and querysets are reduced to their
+    primary keys.
+    """
+    if isinstance(value, models.Model):
+        return (model_label(value.__class__), value.pk)
+    if isinstance(value, QuerySet):
+        # cleaned querysets have already been evaluated by the form field
+        return (model_label(value.model), tuple(sorted(obj.pk for obj in value)))
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize(v) for v in value)
+    if isinstance(value, slice):
+        return ('slice', normalize(value.start), normalize(value.stop))
+    return value
+
+def queryset_key(queryset):
+    """
+    Returns a string identifying the rows selected by ``queryset``.
+    """
+    try:
+        return str(queryset.query)
+    except EmptyResultSet:
+        return '<empty>'
@@ -0,0 +1,98 @@
+"""
+Concurrent evaluation of the independent queries of a FilterSet.
+
+Python 2 has no ``async``/``await``, so the queries run in threads.  Every
+thread uses its own database connections and closes them when it's done,
+except the connections of the calling thread that allow thread sharing (like
+the in-memory SQLite database used by the tests), which are reused.
+"""
+import Queue
+import sys
+import threading
+
+from django.db import connections
+
+class Deferred(object):
+    """
+    The result of ``func(*args, **kwargs)`` computed in another thread.
+    ``result()`` waits for it, and raises the exception of the call if it
+    failed.
+    """
+    def __init__(self, func, *args, **kwargs):
+        self._shared = dict((alias, connections[alias]) for alias in connections
+            if connections[alias].allow_thread_sharing)
+        self._result = None
+        self._exc_info = None
+        self._thread = threading.Thread(target=self._run, args=(func, args, kwargs))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, func, args, kwargs):
+        for alias, connection in self._shared.items():
+            connections[alias] = connection
+        try:
+            try:
+                self._result = func(*args, **kwargs)
+            except Exception:
+                self._exc_info = sys.exc_info()
+        finally:
+            for alias in connections:
+                if alias not in self._shared:
+                    connections[alias].close()
+
+    def done(self):
+        return not self._thread.is_alive()
+
+    def result(self):
+        self._thread.join()
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+def gather(*funcs):
+    """
+    Calls every function concurrently and returns their results in order.
+    """
+    deferreds = [Deferred(func) for func in funcs]
+    return [deferred.result() for deferred in deferreds]
+
+_end = object()
+
+def _put(queue, item, stopped):
+    # Waits for room in queue, unless the consumer has stopped.
+    while not stopped.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Queue.Full:
+            pass
+    return False
+
+def prefetch(iterable):
+    """
+    Iterates over ``iterable``, computing the next item in another thread
+    while the current one is being used.  A single thread, and so a single
+    database connection, serves the whole iteration.  Its queries don't run
+    in the transaction of the calling thread: unless the connection is
+    shared, they don't see the writes the calling thread hasn't committed.
+    """
+    queue = Queue.Queue(1)
+    stopped = threading.Event()
+    def produce():
+        try:
+            for item in iterable:
+                if not _put(queue, item, stopped):
+                    return
+        finally:
+            _put(queue, _end, stopped)
+    worker = Deferred(produce)
+    try:
+        while True:
+            item = queue.get()
+            if item is _end:
+                break
+            yield item
+    finally:
+        stopped.set()
+    # raises the error of the iteration, if any
+    worker.result()
@@ -0,0 +1,37 @@
+"""
+Serialization of filtered rows for the export view.
+
+Every function takes an iterable of lists of value tuples, as returned by
+``pagination.iter_value_chunks``, and yields one string per list.
+"""
+import csv
+import json
+from cStringIO import StringIO
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.encoding import smart_str
+
+def csv_chunks(chunks, fields):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([smart_str(name) for name in fields])
+    for rows in chunks:
+        writer.writerows([[smart_str(value) if value is not None else ''
+            for value in row] for row in rows])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # the header of an empty export
+        yield buffer.getvalue()
+
+def ndjson_chunks(chunks, fields):
+    encoder = DjangoJSONEncoder()
+    for rows in chunks:
+        yield ''.join(encoder.encode(dict(zip(fields, row))) + '\n'
+            for row in rows)
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', csv_chunks),
+    'ndjson': ('application/x-ndjson', ndjson_chunks),
+}
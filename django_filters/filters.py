@@ -1,17 +1,27 @@
-from datetime import datetime, timedelta
+from copy import copy
+from datetime import timedelta
+import inspect
 
 from django import forms
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
 from django.db.models import Q
 from django.db.models.sql.constants import QUERY_TERMS
+from django.utils import timezone
+from django.utils.datastructures import SortedDict
+from django.utils.encoding import force_unicode
 from django.utils.translation import ugettext_lazy as _
 
+from django_filters import cache, search
 from django_filters.fields import RangeField, LookupTypeField
+from django_filters.widgets import RemoteSelect, RemoteSelectMultiple
 
 __all__ = [
     'Filter', 'CharFilter', 'BooleanFilter', 'ChoiceFilter',
     'MultipleChoiceFilter', 'DateFilter', 'DateTimeFilter', 'TimeFilter',
     'ModelChoiceFilter', 'ModelMultipleChoiceFilter', 'NumberFilter',
     'RangeFilter', 'DateRangeFilter', 'AllValuesFilter', 'RelatedObjectFilter',
+    'SearchFilter',
 ]
 
 LOOKUP_TYPES = (
@@ -34,6 +44,9 @@ LOOKUP_TYPES = (
 class Filter(object):
     creation_counter = 0
     field_class = forms.Field
+    # Whether the form field can be shared by every instance of a FilterSet,
+    # filters that compute their field per request set this to False.
+    static_field = True
     
     def __init__(self, name=None, label=None, widget=None, action=None,
         lookup_type='exact', required=False, **kwargs):
@@ -45,10 +58,22 @@ class Filter(object):
         self.widget = widget
         self.required = required
         self.extra = kwargs
+        self._lookups = {}
 
         self.creation_counter = Filter.creation_counter
         Filter.creation_counter += 1
 
+    def __copy__(self):
+        # FilterSet instances work on shallow copies of the class-level
+        # filters: the definition (querysets, choices, widgets) is shared and
+        # only the per-instance state (``extra``, ``model`` and the form field)
+        # is private to the copy.
+        obj = self.__class__.__new__(self.__class__)
+        obj.__dict__.update(self.__dict__)
+        obj.__dict__.pop('_field', None)
+        obj.extra = self.extra.copy()
+        return obj
+
     @property
     def field(self):
         if not hasattr(self, '_field'):
@@ -65,9 +90,48 @@ class Filter(object):
                     label=self.label, widget=self.widget, **self.extra)
         return self._field
 
-    def filter(self, qs, value):
+    @property
+    def query_name(self):
+        """
+        The model field path this filter queries.
+        """
+        return self.name
+
+    def get_lookup(self, lookup):
+        """
+        Returns the ``(key, negate)`` pair for ``lookup``, e.g.
+        ``('name__startswith', True)`` for ``'ex_startswith'``.  The pairs are
+        computed once per filter definition and shared by all of its copies.
+        """
+        query_name = self.query_name
+        try:
+            return self._lookups[query_name, lookup]
+        except KeyError:
+            negate = lookup.startswith('ex_')
+            if negate:
+                key = '%s__%s' % (query_name, lookup[3:])
+            else:
+                key = '%s__%s' % (query_name, lookup)
+            self._lookups[query_name, lookup] = key, negate
+            return key, negate
+
+    def query_lookups(self):
+        """
+        Returns the lookup types this filter can query ``query_name`` with.
+        """
+        if self.lookup_type is None:
+            return [lookup for lookup, label in LOOKUP_TYPES]
+        if isinstance(self.lookup_type, (list, tuple)):
+            return list(self.lookup_type)
+        return [self.lookup_type]
+
+    def get_q(self, value):
+        """
+        Returns the ``Q`` object this filter applies for ``value``, or ``None``
+        if the value doesn't restrict the queryset.
+        """
         if not value:
-            return qs
+            return None
         if isinstance(value, (list, tuple)):
             lookup = str(value[0])
             if not lookup:
@@ -75,12 +139,25 @@ class Filter(object):
             value = value[1]
         else:
             lookup = self.lookup_type
-        if value:
-            if not lookup.startswith('ex_'):
-                return qs.filter(**{'%s__%s' % (self.name, lookup): value})
-            else:
-                return qs.exclude(**{'%s__%s' % (self.name, lookup.replace('ex_', '')): value})
-        return qs
+        if not value:
+            return None
+        key, negate = self.get_lookup(lookup)
+        if negate:
+            return ~Q(**{key: value})
+        return Q(**{key: value})
+
+    def filter(self, qs, value):
+        q = self.get_q(value)
+        if q is None:
+            return qs
+        return qs.filter(q)
+
+    def facet_choice(self, value):
+        """
+        Returns the form value of the choice selecting the database ``value``,
+        used to match facet counts with the choices of the field.
+        """
+        return force_unicode(value)
 
 class CharFilter(Filter):
     field_class = forms.CharField
@@ -88,10 +165,17 @@ class CharFilter(Filter):
 class BooleanFilter(Filter):
     field_class = forms.NullBooleanField
 
-    def filter(self, qs, value):
+    def query_lookups(self):
+        return ['exact']
+
+    def get_q(self, value):
         if value is not None:
-            return qs.filter(**{self.name: value})
-        return qs
+            return Q(**{self.name: value})
+        return None
+
+    def facet_choice(self, value):
+        # the values of NullBooleanSelect
+        return value and u'2' or u'3'
 
 class ChoiceFilter(Filter):
     field_class = forms.ChoiceField
@@ -102,24 +186,24 @@ class MultipleChoiceFilter(Filter):
     """
     field_class = forms.MultipleChoiceField
 
-    def filter(self, qs, value):
+    def query_lookups(self):
+        if isinstance(self.lookup_type, basestring):
+            return ['in']
+        return super(MultipleChoiceFilter, self).query_lookups()
+
+    def get_q(self, value):
         value = value or ()
         lookup = 'in'
         if type(self.field) == LookupTypeField and value:
             lookup, value = value
-        
-        if lookup.startswith('ex_'):
-            filter_type = 'exclude'
-            lookup = lookup.replace('ex_', '')
-        else:
-            filter_type = 'filter'
 
         if not value:
-            return qs
-        
-        kwargs = {'%s__%s' % (self.name, lookup): value}
-        filter_method = getattr(qs, filter_type)
-        return filter_method(**kwargs)
+            return None
+
+        key, negate = self.get_lookup(lookup)
+        if negate:
+            return ~Q(**{key: value})
+        return Q(**{key: value})
 
 class DateFilter(Filter):
     field_class = forms.DateField
@@ -130,11 +214,28 @@ class DateTimeFilter(Filter):
 class TimeFilter(Filter):
     field_class = forms.TimeField
 
-class ModelChoiceFilter(Filter):
+class RemoteChoicesMixin(object):
+    """
+    Lets model choice filters load their choices from a JSON view instead of
+    rendering every object of the queryset.  With ``remote_url`` the widget
+    only renders the selected objects, ``search_field`` is the field of the
+    related model the view matches the search term against.
+    """
+    remote_widget = RemoteSelect
+
+    def __init__(self, *args, **kwargs):
+        self.remote_url = kwargs.pop('remote_url', None)
+        self.search_field = kwargs.pop('search_field', None)
+        if self.remote_url and kwargs.get('widget') is None:
+            kwargs['widget'] = self.remote_widget(self.remote_url)
+        super(RemoteChoicesMixin, self).__init__(*args, **kwargs)
+
+class ModelChoiceFilter(RemoteChoicesMixin, Filter):
     field_class = forms.ModelChoiceField
 
-class ModelMultipleChoiceFilter(MultipleChoiceFilter):
+class ModelMultipleChoiceFilter(RemoteChoicesMixin, MultipleChoiceFilter):
     field_class = forms.ModelMultipleChoiceField
+    remote_widget = RemoteSelectMultiple
 
 class NumberFilter(Filter):
     field_class = forms.DecimalField
@@ -142,49 +243,218 @@ class NumberFilter(Filter):
 class RangeFilter(Filter):
     field_class = RangeField
 
-    def filter(self, qs, value):
+    def query_lookups(self):
+        return ['range']
+
+    def get_q(self, value):
         if value:
-            return qs.filter(**{'%s__range' % self.name: (value.start, value.stop)})
-        return qs
+            return Q(**{'%s__range' % self.name: (value.start, value.stop)})
+        return None
+
+def _midnight(now):
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _make_aware(value, tz):
+    if hasattr(tz, 'localize'):
+        # pytz picks a side of a DST transition instead of raising
+        return tz.localize(value)
+    return value.replace(tzinfo=tz)
+
+def _add_months(day, months):
+    months += day.month - 1
+    return day.replace(year=day.year + months // 12, month=months % 12 + 1)
+
+def today(now):
+    start = _midnight(now)
+    return start, start + timedelta(days=1)
+
+def past_days(days):
+    """
+    Returns the bounds of the last ``days`` days and today.
+    """
+    def bounds(now):
+        start = _midnight(now)
+        return start - timedelta(days=days), start + timedelta(days=1)
+    return bounds
+
+def past(**kwargs):
+    """
+    Returns the bounds of a rolling window ending now, ``kwargs`` are the
+    arguments of ``timedelta``, e.g. ``past(hours=24)``.
+    """
+    delta = timedelta(**kwargs)
+    def bounds(now):
+        return now - delta, None
+    return bounds
+
+def this_month(now):
+    start = _midnight(now).replace(day=1)
+    return start, _add_months(start, 1)
+
+def this_quarter(now):
+    start = _midnight(now).replace(day=1, month=(now.month - 1) // 3 * 3 + 1)
+    return start, _add_months(start, 3)
+
+def _filters_queryset(bounds):
+    # Whether bounds is an option of the former DateRangeFilter API, called
+    # with the queryset and the field name instead of the current time.
+    if bounds is None:
+        return False
+    func = bounds
+    if not inspect.isfunction(func) and not inspect.ismethod(func):
+        func = getattr(bounds, '__call__', None)
+    try:
+        args = inspect.getargspec(func)[0]
+    except TypeError:
+        return False
+    if inspect.ismethod(func) and func.im_self is not None:
+        args = args[1:]
+    return len(args) >= 2
+
+def this_year(now):
+    start = _midnight(now).replace(day=1, month=1)
+    return start, start.replace(year=start.year + 1)
 
 class DateRangeFilter(ChoiceFilter):
-    options = {
-        '': (_('Any Date'), lambda qs, name: qs.all()),
-        1: (_('Today'), lambda qs, name: qs.filter(**{
-            '%s__year' % name: datetime.today().year,
-            '%s__month' % name: datetime.today().month,
-            '%s__day' % name: datetime.today().day
-        })),
-        2: (_('Past 7 days'), lambda qs, name: qs.filter(**{
-            '%s__gte' % name: (datetime.today() - timedelta(days=7)).strftime('%Y-%m-%d'),
-            '%s__lt' % name: (datetime.today()+timedelta(days=1)).strftime('%Y-%m-%d'),
-        })),
-        3: (_('This month'), lambda qs, name: qs.filter(**{
-            '%s__year' % name: datetime.today().year,
-            '%s__month' % name: datetime.today().month
-        })),
-        4: (_('This year'), lambda qs, name: qs.filter(**{
-            '%s__year' % name: datetime.today().year,
-        })),
-    }
+    """
+    Filters on a date range chosen from ``options``, which maps each choice
+    to a ``(label, bounds)`` pair.  ``bounds`` is called with the current
+    local time and returns the ``(start, end)`` of the half-open range, either
+    can be ``None`` for an open end; ``bounds`` itself is ``None`` for a
+    choice that doesn't filter.  Pass ``options`` to the constructor to use
+    other choices.
+    """
+    options = SortedDict([
+        ('', (_('Any Date'), None)),
+        (1, (_('Today'), today)),
+        (2, (_('Past 7 days'), past_days(7))),
+        (3, (_('This month'), this_month)),
+        (4, (_('This year'), this_year)),
+    ])
 
     def __init__(self, *args, **kwargs):
+        if 'options' in kwargs:
+            self.options = SortedDict(kwargs.pop('options'))
         kwargs['choices'] = [(key, value[0]) for key, value in self.options.iteritems()]
         super(DateRangeFilter, self).__init__(*args, **kwargs)
+        if any(_filters_queryset(value[1]) for value in self.options.itervalues()):
+            # Options written for the former API filter the queryset
+            # themselves, the filter is then applied through filter() only.
+            self.filter = self.filter_options
 
-    def filter(self, qs, value):
-        try:
-            value = int(value)
-        except (ValueError, TypeError):
+    def __copy__(self):
+        obj = super(DateRangeFilter, self).__copy__()
+        obj.__dict__.pop('_now', None)
+        if 'filter' in obj.__dict__:
+            obj.filter = obj.filter_options
+        return obj
+
+    def get_option(self, value):
+        """
+        Returns the key of ``options`` selected by ``value``, or None.
+        """
+        if value is None:
             value = ''
-        return self.options[value][1](qs, self.name)
+        if value not in self.options:
+            # the form cleans the integer keys of the default options to
+            # strings
+            try:
+                value = int(value)
+            except (ValueError, TypeError):
+                return None
+        if value not in self.options:
+            return None
+        return value
+
+    def filter_options(self, qs, value):
+        """
+        Applies the option selected by ``value``, calling the options of the
+        former ``(label, lambda qs, name: ...)`` form with the queryset and
+        the name of the field.
+        """
+        key = self.get_option(value)
+        if key is not None and _filters_queryset(self.options[key][1]):
+            return self.options[key][1](qs, self.name)
+        return super(DateRangeFilter, self).filter(qs, value)
+
+    def get_now(self):
+        """
+        Returns the current local time as a naive datetime.  It's read once
+        per copy of the filter, so all the ranges of a ``FilterSet`` agree.
+        """
+        if not hasattr(self, '_now'):
+            now = timezone.now()
+            if timezone.is_aware(now):
+                now = timezone.make_naive(now, timezone.get_current_timezone())
+            self._now = now
+        return self._now
 
+    def get_bounds(self, value):
+        """
+        Returns the ``(start, end)`` of the range selected by ``value``, or
+        ``None`` if it doesn't filter.
+        """
+        key = self.get_option(value)
+        if key is None:
+            return None
+        bounds = self.options[key][1]
+        if bounds is None or _filters_queryset(bounds):
+            return None
+        start, end = bounds(self.get_now())
+        if settings.USE_TZ:
+            tz = timezone.get_current_timezone()
+            start, end = [bound is not None and _make_aware(bound, tz) or None
+                for bound in (start, end)]
+        return start, end
+
+    def query_lookups(self):
+        return ['gte', 'lt']
+
+    def get_q(self, value):
+        bounds = self.get_bounds(value)
+        if bounds is None:
+            return None
+        lookups = {}
+        if bounds[0] is not None:
+            lookups['%s__gte' % self.name] = bounds[0]
+        if bounds[1] is not None:
+            lookups['%s__lt' % self.name] = bounds[1]
+        return Q(**lookups)
 
 class AllValuesFilter(ChoiceFilter):
+    """
+    A ``ChoiceFilter`` whose choices are the distinct values of the field in
+    the database.  If ``cache_timeout`` is given the choices are kept in the
+    ``cache_alias`` cache for that many seconds, and with ``invalidate`` they
+    are recomputed as soon as an instance of the model is saved or deleted.
+    """
+    static_field = False
+
+    def __init__(self, *args, **kwargs):
+        self.cache_timeout = kwargs.pop('cache_timeout', None)
+        self.cache_alias = kwargs.pop('cache_alias', 'default')
+        self.invalidate = kwargs.pop('invalidate', False)
+        super(AllValuesFilter, self).__init__(*args, **kwargs)
+
+    def get_choices(self):
+        qs = self.model._default_manager.distinct().order_by(self.name).values_list(self.name, flat=True)
+        if self.cache_timeout is None:
+            return [(o, o) for o in qs]
+        if self.invalidate:
+            cache.track_model(self.model, self.cache_alias)
+        key = cache.make_key('choices', self.model, (self.name, str(qs.query)),
+            self.cache_alias)
+        backend = cache.get_backend(self.cache_alias)
+        choices = backend.get(key)
+        if choices is None:
+            choices = [(o, o) for o in qs]
+            backend.set(key, choices, self.cache_timeout)
+        return choices
+
     @property
     def field(self):
-        qs = self.model._default_manager.distinct().order_by(self.name).values_list(self.name, flat=True)
-        self.extra['choices'] = [(o, o) for o in qs]
+        if not hasattr(self, '_field'):
+            self.extra['choices'] = self.get_choices()
         return super(AllValuesFilter, self).field
         
         
@@ -194,6 +464,12 @@ class RelatedObjectFilter(Filter):
         self.rel_obj_field = rel_obj_field
         self.rel_filter = None
         super(RelatedObjectFilter, self).__init__(**kwargs)
+
+    def __copy__(self):
+        obj = super(RelatedObjectFilter, self).__copy__()
+        if self.rel_filter is not None:
+            obj.rel_filter = copy(self.rel_filter)
+        return obj
     
     @property
     def field(self):
@@ -202,20 +478,46 @@ class RelatedObjectFilter(Filter):
                 self.rel_filter.label = self.label
             return self.rel_filter.field
         return super(RelatedObjectFilter, self).field
-        
+
+    @property
+    def query_name(self):
+        return self.rel_obj_field
+
+    def query_lookups(self):
+        if self.rel_filter is not None:
+            return self.rel_filter.query_lookups()
+        return super(RelatedObjectFilter, self).query_lookups()
+
+
+class SearchFilter(CharFilter):
+    """
+    Searches the model ``fields`` for every term of the value with the
+    full-text search of the database, see ``django_filters.search``.  With
+    ``rank`` the results are ordered by relevance unless an ordering is
+    selected.
+    """
+
+    def __init__(self, fields, backend=None, rank=True, **kwargs):
+        self.fields = fields
+        self.backend = backend
+        self.rank = rank
+        super(SearchFilter, self).__init__(**kwargs)
+
+    def get_backend(self, connection):
+        return self.backend or search.get_backend(connection)
+
     def filter(self, qs, value):
-        if not value:
+        terms = value and value.split()
+        if not terms:
             return qs
-        if isinstance(value, (list, tuple)):
-            lookup, value = value
-            if not lookup:
-                lookup = 'exact' # we fallback to exact if no choice for lookup is provided
-        else:
-            lookup = self.lookup_type
-        if value:
-            if not lookup.startswith('ex_'):
-                return qs.filter(**{'%s__%s' % (self.rel_obj_field, lookup): value})
-            else:
-                return qs.exclude(**{'%s__%s' % (self.rel_obj_field, lookup.replace('ex_', '')): value})
-        return qs
-    
+        connection = connections[qs.db]
+        return self.get_backend(connection).search(qs, self.fields, terms,
+            connection, self.rank)
+
+    def install(self, model, using=DEFAULT_DB_ALIAS):
+        """
+        Creates what the backend needs to search the fields of ``model`` in
+        the ``using`` database.  Returns True if anything was created.
+        """
+        connection = connections[using]
+        return self.get_backend(connection).install(model, self.fields, connection)
@@ -1,18 +1,27 @@
-from copy import deepcopy
+from copy import copy
+import hashlib
+import operator
 import re
 import json
+import threading
+import time
 
 from django import forms
-from django.forms.forms import BoundField
+from django.core.exceptions import ImproperlyConfigured
+from django.forms.forms import BoundField, pretty_name
+from django.forms.util import ErrorDict
 from django.db import models
+from django.db.models import Q
 from django.db.models.fields import FieldDoesNotExist
 from django.db.models.related import RelatedObject
 from django.db.models.sql.constants import LOOKUP_SEP
 from django.utils.datastructures import SortedDict
+from django.utils.functional import curry
 from django.utils.text import capfirst
-from django.utils.translation import gettext as _
+from django.utils.translation import gettext as _, get_language
 from django.utils.safestring import mark_safe
 
+from django_filters import cache, concurrent, instrumentation, pagination, query
 from django_filters.filters import Filter, CharFilter, BooleanFilter, \
     ChoiceFilter, DateFilter, DateTimeFilter, TimeFilter, ModelChoiceFilter, \
     ModelMultipleChoiceFilter, NumberFilter, RelatedObjectFilter
@@ -41,7 +50,21 @@ def get_declared_filters(bases, attrs, with_base_filters=True):
 
     return SortedDict(filters)
 
+_model_field_cache = {}
+
 def get_model_field(model, f):
+    """
+    Returns the model field the path ``f`` leads to from ``model``, or None if
+    there is no such field.  Paths are resolved once per model.
+    """
+    try:
+        return _model_field_cache[model, f]
+    except KeyError:
+        pass
+    field = _model_field_cache[model, f] = _get_model_field(model, f)
+    return field
+
+def _get_model_field(model, f):
     parts = f.split(LOOKUP_SEP)
     opts = model._meta
     for name in parts[:-1]:
@@ -63,6 +86,61 @@ def get_model_field(model, f):
         return rel.field.rel.to_field
     return rel
 
+_multivalued_cache = {}
+
+def is_multivalued(model, path):
+    """
+    Returns True if querying ``path`` on ``model`` traverses a many-to-many or
+    reverse foreign key relation, i.e. if it can produce duplicate rows.
+    """
+    try:
+        return _multivalued_cache[model, path]
+    except KeyError:
+        pass
+    multivalued = False
+    opts = model._meta
+    for name in path.split(LOOKUP_SEP):
+        try:
+            field, _, direct, m2m = opts.get_field_by_name(name)
+        except FieldDoesNotExist:
+            # the rest of the path is a lookup type
+            break
+        if m2m or (not direct and not field.field.unique):
+            multivalued = True
+            break
+        if not direct:
+            opts = field.opts
+        elif field.rel:
+            opts = field.rel.to._meta
+        else:
+            break
+    _multivalued_cache[model, path] = multivalued
+    return multivalued
+
+_uses_q_cache = {}
+
+def uses_q(filter_):
+    """
+    Returns True if ``filter_`` applies itself through ``Filter.get_q``,
+    False if it has a custom ``action`` or overrides ``filter()`` only.
+    """
+    if 'filter' in filter_.__dict__:
+        return False
+    klass = filter_.__class__
+    try:
+        return _uses_q_cache[klass]
+    except KeyError:
+        pass
+    for base in klass.__mro__:
+        if 'get_q' in base.__dict__:
+            result = True
+            break
+        if 'filter' in base.__dict__:
+            result = False
+            break
+    _uses_q_cache[klass] = result
+    return result
+
 def filters_for_model(model, fields=None, exclude=None, filter_for_field=None):
     field_dict = SortedDict()
     opts = model._meta
@@ -80,13 +158,86 @@ def filters_for_model(model, fields=None, exclude=None, filter_for_field=None):
             field_dict[f] = filter_
     return field_dict
 
-def init_subfilters(cls):
-    for filter_ in cls.declared_filters.values():
+def init_subfilters(cls, filters):
+    for filter_ in filters.values():
         if isinstance(filter_, RelatedObjectFilter):
             field = get_model_field(cls._meta.model, filter_.rel_obj_field)
             filter_.rel_filter = cls.filter_for_field(field, field.name)
             filter_.rel_filter.lookup_type = filter_.lookup_type
  
+def _filter_definition(filter_):
+    definition = (filter_.__class__, filter_.name, filter_.label,
+        filter_.widget, filter_.lookup_type, filter_.required, filter_.extra)
+    rel_filter = getattr(filter_, 'rel_filter', None)
+    if rel_filter is not None:
+        definition += (_filter_definition(rel_filter),)
+    return definition
+
+def _has_field(filter_):
+    # Returns True if the form field of filter_ has been instantiated.
+    rel_filter = getattr(filter_, 'rel_filter', None)
+    if rel_filter is not None:
+        return _has_field(rel_filter)
+    return '_field' in filter_.__dict__
+
+def _field_definition(field):
+    if field is None:
+        return None
+    return (field.__class__, field.widget.__class__, field.label,
+        tuple(getattr(field, 'choices', ())))
+
+class FieldValuesMixin(object):
+    # Keeps the values of the fields that validated in ``field_values``:
+    # Django deletes ``cleaned_data`` as soon as one field has an error, but a
+    # FilterSet still applies the filters whose values are valid.
+    def _post_clean(self):
+        super(FieldValuesMixin, self)._post_clean()
+        self.field_values = self.cleaned_data.copy()
+
+def track_models(cls):
+    """
+    Invalidates the values cached for the FilterSet class ``cls`` whenever an
+    instance of its model is saved or deleted.  This is set up when the class
+    is defined, so that processes which only write to the model invalidate
+    the values too.
+    """
+    opts = cls._meta
+    if opts.model is None:
+        return
+    if (opts.count_cache_timeout, opts.result_cache_timeout,
+        opts.facet_cache_timeout) != (None, None, None):
+        cache.track_model(opts.model, opts.cache_alias)
+    for filter_ in cls.declared_filters.itervalues():
+        if getattr(filter_, 'invalidate', False):
+            cache.track_model(opts.model, filter_.cache_alias)
+    if getattr(cls, 'options_cache_timeout', None) is not None and not opts.lazy:
+        for model in cls.get_options_models():
+            cache.track_model(model, cls.options_cache_alias)
+
+def cached(opts, name, timeout, state, compute):
+    # Returns compute() through the opts.cache_alias cache when timeout is not
+    # None, the values are invalidated when the model is saved or deleted (see
+    # track_models).
+    if timeout is None:
+        return compute()
+    key = cache.make_key(name, opts.model, state, opts.cache_alias)
+    backend = cache.get_backend(opts.cache_alias)
+    value = backend.get(key)
+    if value is None:
+        value = compute()
+        backend.set(key, value, timeout)
+    return value
+
+def _estimate(queryset, estimate_above):
+    # The planner's estimate of the rows of queryset if it is above
+    # estimate_above, estimates are not memoized nor cached like exact counts.
+    if estimate_above is None:
+        return None
+    estimate = query.estimate_count(queryset.order_by())
+    if estimate is not None and estimate > estimate_above:
+        return estimate
+    return None
+
 class FilterSetOptions(object):
     def __init__(self, options=None):
         self.model = getattr(options, 'model', None)
@@ -95,6 +246,19 @@ class FilterSetOptions(object):
 
         self.order_by = getattr(options, 'order_by', False)
 
+        self.use_subqueries = getattr(options, 'use_subqueries', False)
+
+        self.lazy = getattr(options, 'lazy', False)
+
+        self.count_cache_timeout = getattr(options, 'count_cache_timeout', None)
+        self.cache_alias = getattr(options, 'cache_alias', 'default')
+
+        self.result_cache_timeout = getattr(options, 'result_cache_timeout', None)
+        self.result_cache_max_rows = getattr(options, 'result_cache_max_rows', 1000)
+
+        self.facets = getattr(options, 'facets', ())
+        self.facet_cache_timeout = getattr(options, 'facet_cache_timeout', None)
+
         self.form = getattr(options, 'form', forms.Form)
 
 class FilterSetMetaclass(type):
@@ -106,24 +270,84 @@ class FilterSetMetaclass(type):
             parents = None
         declared_filters = get_declared_filters(bases, attrs, False)
         new_class = super(FilterSetMetaclass, cls).__new__(cls, name, bases, attrs)
+        new_class._form_classes = {}
         if not parents:
             return new_class
         
         opts = new_class._meta = FilterSetOptions(getattr(new_class, 'Meta', None))
-        if opts.model:
-            filters = filters_for_model(opts.model, opts.fields, opts.exclude, new_class.filter_for_field)
-            filters.update(declared_filters)
-        else:
-            filters = declared_filters
-        if None in filters.values():
-            raise TypeError("Meta.fields contains a field that isn't defined "
-                "on this FilterSet")
-
         new_class.declared_filters = declared_filters
-        new_class.base_filters = filters
-        init_subfilters(new_class)
+        if opts.lazy:
+            new_class.base_filters = LazyFilters()
+            _lazy_lock.acquire()
+            try:
+                _lazy_classes.append(new_class)
+            finally:
+                _lazy_lock.release()
+        else:
+            new_class.base_filters = build_base_filters(new_class)
+        track_models(new_class)
         return new_class
 
+def build_base_filters(cls):
+    """
+    Returns the filters of a FilterSet class: the filters generated for the
+    fields of ``Meta.model`` and the declared ones.
+    """
+    opts = cls._meta
+    # The declared filters are shared with the subclasses, every class gets
+    # its own copies so setting up the subfilters doesn't leak between them.
+    declared_filters = SortedDict([(name, copy(filter_))
+        for name, filter_ in cls.declared_filters.iteritems()])
+    init_subfilters(cls, declared_filters)
+    if opts.model:
+        filters = filters_for_model(opts.model, opts.fields, opts.exclude, cls.filter_for_field)
+        filters.update(declared_filters)
+    else:
+        filters = declared_filters
+    if None in filters.values():
+        raise TypeError("Meta.fields contains a field that isn't defined "
+            "on this FilterSet")
+    for name in opts.facets:
+        if name not in filters:
+            raise ImproperlyConfigured("Meta.facets of %s contains '%s', "
+                "which isn't a filter" % (cls.__name__, name))
+    return filters
+
+_lazy_lock = threading.RLock()
+_lazy_classes = []
+
+class LazyFilters(object):
+    """
+    The ``base_filters`` of a FilterSet class with ``Meta.lazy``, built on
+    first access.  The descriptor then replaces itself with the filters.  If
+    building them fails the error is raised again on every access.
+    """
+    def __get__(self, instance, owner):
+        _lazy_lock.acquire()
+        try:
+            filters = owner.__dict__.get('base_filters')
+            if filters is self:
+                filters = build_base_filters(owner)
+                owner.base_filters = filters
+                _lazy_classes.remove(owner)
+        finally:
+            _lazy_lock.release()
+        return filters
+
+def warmup():
+    """
+    Builds the filters of every lazy FilterSet class defined so far, e.g. in
+    a server hook run before the workers handle requests.  Errors in the
+    definitions of the classes are raised here.
+    """
+    _lazy_lock.acquire()
+    try:
+        classes = list(_lazy_classes)
+    finally:
+        _lazy_lock.release()
+    for cls in classes:
+        cls.base_filters
+
 FILTER_FOR_DBFIELD_DEFAULTS = {
     models.CharField: {
         'filter_class': CharFilter
@@ -218,52 +442,442 @@ class BaseFilterSet(object):
             queryset = self._meta.model._default_manager.all()
         self.queryset = queryset
         self.form_prefix = prefix
+        self._recorder = instrumentation.get_recorder(self)
 
-        self.filters = deepcopy(self.base_filters)
-        # propagate the model being used through the filters
-        for filter_ in self.filters.values():
+        self.filters = SortedDict()
+        for name, filter_ in self.base_filters.iteritems():
+            filter_ = copy(filter_)
+            # propagate the model being used through the filters
             filter_.model = self._meta.model
+            self.filters[name] = filter_
 
     def __iter__(self):
+        if self._meta.result_cache_timeout is None:
+            results = self.qs
+        else:
+            results = self._iter_cached_results()
+        for obj in results:
+            yield obj
+
+    def _iter_cached_results(self):
+        # Iterates over the results, fetched by primary key in the cached
+        # order if the results of the current state are cached: the filtering
+        # query doesn't run again.  Otherwise the primary keys, along with the
+        # values of the extra selects and annotations (which fetching by
+        # primary key doesn't compute), are cached once the results have been
+        # iterated over, unless there are more than Meta.result_cache_max_rows
+        # of them.
+        opts = self._meta
+        key = cache.make_key('results', opts.model, self.get_state(),
+            opts.cache_alias)
+        backend = cache.get_backend(opts.cache_alias)
+        rows = backend.get(key)
+        if rows is not None and not query.is_fetched(self.qs):
+            names, rows = rows
+            objs = self.queryset.in_bulk([pk for pk, values in rows])
+            for pk, values in rows:
+                if pk in objs:
+                    obj = objs[pk]
+                    for name, value in zip(names, values):
+                        setattr(obj, name, value)
+                    yield obj
+            return
+        names = (list(self.qs.query.extra_select) +
+            list(self.qs.query.aggregate_select))
+        rows = []
         for obj in self.qs:
+            if rows is not None:
+                rows.append((obj.pk,
+                    tuple(getattr(obj, name) for name in names)))
+                if len(rows) > opts.result_cache_max_rows:
+                    rows = None
             yield obj
+        if rows is not None:
+            backend.set(key, (names, rows), opts.result_cache_timeout)
 
     @property
     def qs(self):
         if not hasattr(self, '_qs'):
-            qs = self.queryset.all()
-            for name, filter_ in self.filters.iteritems():
-                try:
-                    if self.is_bound:
-                        data = self.form[name].data
-                    else:
-                        data = self.form.initial.get(name, self.form[name].field.initial)
-                    val = self.form.fields[name].clean(data)
-                    qs = filter_.filter(qs, val)
-                except forms.ValidationError:
-                    pass
-            if self._meta.order_by:
-                try:
-                    value = self.form.fields[ORDER_BY_FIELD].clean(self.form[ORDER_BY_FIELD].data)
-                    if value:
-                        qs = qs.order_by(value)
-                except forms.ValidationError:
-                    pass
+            qs = self.filter_queryset(self.queryset.all())
+            ordering = self.get_ordering()
+            if ordering:
+                qs = qs.order_by(*ordering)
+            if self._recorder is not None:
+                qs = instrumentation.instrument_queryset(qs, self._recorder)
             self._qs = qs
         return self._qs
 
+    def count(self, estimate_above=None):
+        """
+        Returns the number of results.  The count is computed once per
+        instance, without the ordering, and is cached across requests for
+        ``Meta.count_cache_timeout`` seconds.  If ``estimate_above`` is given
+        and the database planner expects more rows than that, its estimate is
+        returned instead of running a ``COUNT``.  Estimates are never cached.
+        """
+        if not hasattr(self, '_count'):
+            if hasattr(self, '_qs') and query.is_fetched(self._qs):
+                self._count = len(self._qs)
+            else:
+                estimate = _estimate(self.qs, estimate_above)
+                if estimate is not None:
+                    return estimate
+                self._count = cached(self._meta, 'count',
+                    self._meta.count_cache_timeout, self.get_state(ordered=False),
+                    lambda: query.count(self.qs))
+        return self._count
+
+    def exists(self):
+        """
+        Returns True if there is any result.
+        """
+        if hasattr(self, '_count'):
+            return self._count > 0
+        if hasattr(self, '_qs') and query.is_fetched(self._qs):
+            return bool(self._qs)
+        return query.exists(self.qs)
+
+    def facets(self):
+        """
+        Returns the number of results for each value of the filters listed in
+        ``Meta.facets``, as a dict mapping filter names to ``{value: count}``
+        dicts.  The counts for a filter take every other active filter into
+        account, and are cached for ``Meta.facet_cache_timeout`` seconds.
+        """
+        if not hasattr(self, '_facets'):
+            self._facets = cached(self._meta, 'facets',
+                self._meta.facet_cache_timeout, self.get_state(ordered=False),
+                self._compute_facets)
+        return self._facets
+
+    def _compute_facets(self):
+        values = list(self._cleaned_values())
+        active = {}
+        for name, filter_, value in values:
+            if self._get_condition(filter_, value)[0] is not None:
+                # whether applying the filter can produce duplicate rows
+                active[name] = not uses_q(filter_) or is_multivalued(
+                    self._meta.model, filter_.query_name)
+        # Facets whose filter isn't active are counted over the same queryset,
+        # it's only built once.
+        querysets = {}
+        facets = {}
+        for name in self._meta.facets:
+            excluded = name in active and name or None
+            if excluded not in querysets:
+                others = [v for v in values if v[0] != excluded]
+                distinct = any(duplicates for other, duplicates in active.items()
+                    if other != excluded)
+                querysets[excluded] = (self._filter_queryset(self.queryset.all(),
+                    others).order_by(), distinct)
+            queryset, distinct = querysets[excluded]
+            path = self.filters[name].query_name
+            rows = queryset.values(path).annotate(
+                facet_count=models.Count('pk', distinct=distinct))
+            facets[name] = dict((row[path], row['facet_count']) for row in rows)
+        return facets
+
+    def get_facet_counts(self, name):
+        """
+        Returns the counts of ``facets()`` for the filter ``name``, keyed by
+        the form values of its choices.
+        """
+        filter_ = self.filters[name]
+        counts = {}
+        for value, count in self.facets()[name].iteritems():
+            if value is not None:
+                counts[filter_.facet_choice(value)] = count
+        return counts
+
+    def aqs_list(self):
+        """
+        Returns a ``Deferred`` list of the results, fetched in another thread.
+        """
+        return concurrent.Deferred(list, self._prepare_qs())
+
+    def acount(self, estimate_above=None):
+        """
+        Returns a ``Deferred`` result of ``count()``.
+        """
+        self._prepare_qs()
+        return concurrent.Deferred(self.count, estimate_above)
+
+    def afacets(self):
+        """
+        Returns a ``Deferred`` result of ``facets()``.
+        """
+        self._prepare_qs()
+        return concurrent.Deferred(self.facets)
+
+    def aiter(self, size=1000):
+        """
+        Iterates over the results like ``stream()``, fetching the next chunk
+        of ``size`` objects in another thread while the current one is used.
+        The same thread, and database connection, fetches every chunk.
+        """
+        for chunk in concurrent.prefetch(self.iter_chunks(size)):
+            for obj in chunk:
+                yield obj
+
+    def prefetch(self, count=False, facets=False):
+        """
+        Runs the queries this FilterSet needs concurrently: first the choices
+        of the filters computing their field per request, then the results
+        along with ``count()`` and ``facets()`` if asked for.  Their results
+        are kept, so using them afterwards doesn't hit the database.
+        """
+        concurrent.gather(*[lambda filter_=filter_: filter_.field
+            for filter_ in self.filters.values() if not filter_.static_field])
+        qs = self._prepare_qs()
+        funcs = [lambda: len(qs)]
+        if count:
+            funcs.append(self.count)
+        if facets:
+            funcs.append(self.facets)
+        concurrent.gather(*funcs)
+
+    def _prepare_qs(self):
+        # Validates the form and builds the queryset in the calling thread,
+        # so the threads only run queries.
+        self.cleaned_data
+        return self.qs
+
+    def get_state(self, ordered=True):
+        """
+        Returns a canonical description of the results of this FilterSet, the
+        cleaned value of every filter and, if ``ordered``, the ordering, for
+        use in cache keys.
+        """
+        values = sorted((name, cache.normalize(value))
+            for name, filter_, value in self._cleaned_values())
+        state = (self.__class__.__module__, self.__class__.__name__,
+            cache.queryset_key(self.queryset), tuple(values))
+        if ordered:
+            state += (tuple(self.get_ordering()),)
+        return state
+
+    def get_ordering(self):
+        """
+        Returns the ``order_by()`` arguments selected in the form.
+        """
+        if self._meta.order_by:
+            value = self.cleaned_data.get(ORDER_BY_FIELD)
+            if value:
+                return [value]
+        return []
+
+    def iter_chunks(self, size=1000):
+        """
+        Iterates over the results in lists of at most ``size`` objects.  The
+        chunks are fetched with keyset pagination on the ordering, so memory
+        use doesn't grow with the number of results.
+        """
+        return pagination.iter_chunks(self.qs, self.get_ordering(), size)
+
+    def stream(self, size=1000):
+        """
+        Iterates over the results like ``__iter__`` without caching them,
+        fetching ``size`` objects per query.
+        """
+        for chunk in self.iter_chunks(size):
+            for obj in chunk:
+                yield obj
+
+    def page(self, cursor=None, size=20):
+        """
+        Returns the ``Page`` of ``size`` results following ``cursor``, which
+        is the ``next_cursor`` of the previous page or None for the first one.
+        Pages are selected with keyset pagination on the ordering rather than
+        with OFFSET, so deep pages are as cheap as the first one.
+        """
+        return pagination.get_page(self.qs, self.get_ordering(), cursor, size)
+
+    def filter_queryset(self, queryset):
+        """
+        Applies the filters to ``queryset``.  Conditions that can be expressed
+        as ``Q`` objects are combined and applied with a single ``filter()``
+        call.  Filters with custom actions and filters joining multi-valued
+        relations are applied one by one, so their semantics are unchanged.
+        """
+        return self._filter_queryset(queryset, self._cleaned_values())
+
+    def _filter_queryset(self, queryset, values):
+        recorder = self._recorder
+        conditions = []
+        for name, filter_, value in values:
+            if recorder is not None:
+                start = time.time()
+            if not uses_q(filter_):
+                queryset = filter_.filter(queryset, value)
+            else:
+                q, multivalued = self._get_condition(filter_, value)
+                if q is not None and multivalued:
+                    queryset = queryset.filter(q)
+                elif q is not None:
+                    conditions.append(q)
+            if recorder is not None:
+                recorder.record('filter', name, time.time() - start)
+        if conditions:
+            queryset = queryset.filter(reduce(operator.and_, conditions))
+        return queryset
+
+    def get_q(self):
+        """
+        Returns a single ``Q`` object equivalent to the active filters, so
+        several FilterSets can be combined in one query.  Filters with custom
+        actions are turned into a ``pk__in`` subquery.
+        """
+        return self._compile_q()[0]
+
+    def _compile_q(self):
+        # Returns the Q object for the active filters and whether it joins a
+        # multi-valued relation (and so needs distinct()).
+        if not hasattr(self, '_q'):
+            recorder = self._recorder
+            conditions = []
+            joined = []
+            for name, filter_, value in self._cleaned_values():
+                if recorder is not None:
+                    start = time.time()
+                q, multivalued = self._get_condition(filter_, value)
+                if q is not None and multivalued:
+                    joined.append(q)
+                elif q is not None:
+                    conditions.append(q)
+                if recorder is not None:
+                    recorder.record('filter', name, time.time() - start)
+            distinct = bool(joined)
+            if len(joined) > 1:
+                # _filter_queryset() applies each of them with its own
+                # filter() call, and so its own join: conditions combined in
+                # a single Q object would share a join and have to match the
+                # same related row.
+                manager = self._meta.model._default_manager
+                joined = [Q(pk__in=manager.filter(q).values('pk')) for q in joined]
+                distinct = False
+            conditions.extend(joined)
+            if conditions:
+                self._q = reduce(operator.and_, conditions), distinct
+            else:
+                self._q = Q(), False
+        return self._q
+
+    def _get_condition(self, filter_, value):
+        # Returns a (q, multivalued) pair for a cleaned value, q is None if the
+        # value doesn't restrict the queryset.
+        manager = self._meta.model._default_manager
+        if not uses_q(filter_):
+            base = manager.all()
+            filtered = filter_.filter(base, value)
+            if filtered is base:
+                return None, False
+            # the ordering of a subquery is irrelevant
+            return Q(pk__in=filtered.order_by().values('pk')), False
+        q = filter_.get_q(value)
+        if q is None or not is_multivalued(self._meta.model, filter_.query_name):
+            return q, False
+        if self._meta.use_subqueries:
+            return Q(pk__in=manager.filter(q).values('pk')), False
+        return q, True
+
+    @property
+    def cleaned_data(self):
+        """
+        The cleaned values of the form fields that validated, including the
+        ordering field.  Unbound FilterSets clean the initial values.  The
+        form is validated once and every use of the values shares them.
+        """
+        if not hasattr(self, '_cleaned_data'):
+            form = self.form
+            if self._recorder is not None:
+                start = time.time()
+            if self.is_bound:
+                # full_clean() is run once, and its errors are reused when the
+                # form is rendered
+                form.errors
+                self._cleaned_data = form.field_values
+            else:
+                self._cleaned_data = {}
+                for name, field in form.fields.iteritems():
+                    try:
+                        self._cleaned_data[name] = field.clean(
+                            form.initial.get(name, field.initial))
+                    except forms.ValidationError:
+                        pass
+            if self._recorder is not None:
+                self._recorder.record('validation', None, time.time() - start)
+        return self._cleaned_data
+
+    @property
+    def errors(self):
+        """
+        The errors of the form fields, invalid fields don't filter the results.
+        """
+        if self.is_bound:
+            return self.form.errors
+        return ErrorDict()
+
+    def _cleaned_values(self):
+        cleaned_data = self.cleaned_data
+        for name, filter_ in self.filters.iteritems():
+            if name in cleaned_data:
+                yield name, filter_, cleaned_data[name]
+
     @property
     def form(self):
         if not hasattr(self, '_form'):
-            fields = SortedDict([(name, filter_.field) for name, filter_ in self.filters.iteritems()])
-            fields[ORDER_BY_FIELD] = self.ordering_field
-            Form =  type('%sForm' % self.__class__.__name__, (self._meta.form,), fields)
+            if self._recorder is not None:
+                start = time.time()
+            Form = self.get_form_class()
             if self.is_bound:
                 self._form = Form(self.data, prefix=self.form_prefix)
             else:
                 self._form = Form(prefix=self.form_prefix)
+            for name, filter_ in self.filters.iteritems():
+                if not filter_.static_field:
+                    self._form.fields[name] = filter_.field
+            for name in self._meta.facets:
+                widget = self._form.fields[name].widget
+                if hasattr(widget, 'counts'):
+                    widget.counts = curry(self.get_facet_counts, name)
+            if self._recorder is not None:
+                self._recorder.record('form', None, time.time() - start)
         return self._form
 
+    def get_form_class(self):
+        """
+        Returns the form class for this FilterSet.  The class is built once per
+        FilterSet class and ordering configuration and reused for every
+        instance whose filters have not been modified.
+        """
+        key = (self._meta.form, _field_definition(self.ordering_field))
+        form_classes = self.__class__.__dict__.get('_form_classes')
+        if form_classes is None or self._filters_modified():
+            return self._build_form_class()
+        if key not in form_classes:
+            form_classes[key] = self._build_form_class()
+        return form_classes[key]
+
+    def _build_form_class(self):
+        fields = SortedDict([(name, filter_.field) for name, filter_ in self.filters.iteritems()])
+        # form fields are ordered by creation, so the ordering field has to be
+        # created after the filter fields
+        fields[ORDER_BY_FIELD] = self.get_ordering_field()
+        return type('%sForm' % self.__class__.__name__,
+            (FieldValuesMixin, self._meta.form), fields)
+
+    def _filters_modified(self):
+        if self.filters.keys() != self.base_filters.keys():
+            return True
+        for name, filter_ in self.filters.iteritems():
+            # a field instantiated on the instance may have been changed, e.g.
+            # its queryset or label
+            if filter_.static_field and _has_field(filter_):
+                return True
+            if _filter_definition(filter_) != _filter_definition(self.base_filters[name]):
+                return True
+        return False
+
     def get_ordering_field(self):
         if self._meta.order_by:
             if isinstance(self._meta.order_by, (list, tuple)):
@@ -280,8 +894,6 @@ class BaseFilterSet(object):
     
     @classmethod
     def filter_for_field(cls, f, name):
-        filter_for_field = dict(FILTER_FOR_DBFIELD_DEFAULTS, **cls.filter_overrides)
-
         default = {
             'name': name,
             'label': capfirst(f.verbose_name)
@@ -291,7 +903,7 @@ class BaseFilterSet(object):
             default['choices'] = f.choices
             return ChoiceFilter(**default)
 
-        data = filter_for_field.get(f.__class__)
+        data = get_filter_data(f.__class__, cls.filter_overrides)
         
         if data is None:
             return
@@ -300,11 +912,44 @@ class BaseFilterSet(object):
         if filter_class is not None:
             return filter_class(**default)
 
+_filter_data_cache = {}
+
+def get_filter_data(field_class, overrides):
+    """
+    Returns the ``filter_class``/``extra`` dict for a model field class from
+    ``overrides`` or ``FILTER_FOR_DBFIELD_DEFAULTS``, or None if the class
+    isn't registered.  Subclasses of registered field classes use the entry
+    of their closest registered base class.  The result is computed once per
+    field class and overrides dict.
+    """
+    key = id(overrides), field_class
+    try:
+        cached_overrides, data = _filter_data_cache[key]
+        if cached_overrides is overrides:
+            return data
+    except KeyError:
+        pass
+    data = None
+    for klass in field_class.__mro__:
+        data = overrides.get(klass, FILTER_FOR_DBFIELD_DEFAULTS.get(klass))
+        if data is not None:
+            break
+    # the overrides dict is kept so its id can't be reused by another one
+    _filter_data_cache[key] = overrides, data
+    return data
+
 class FilterSet(BaseFilterSet):
     __metaclass__ = FilterSetMetaclass
 
 class DynamicFilterSet(FilterSet):
-    
+    # The unbound options payload is cached per class and language for
+    # options_cache_timeout seconds, until an object of the model or of the
+    # models of the choices is saved or deleted.  Bump options_version to
+    # discard the cached payloads of a class.
+    options_cache_timeout = None
+    options_cache_alias = 'default'
+    options_version = 1
+
     def get_filters_as_options(self):
         fields = {}
         for name, filter_ in self.filters.iteritems():
@@ -314,30 +959,92 @@ class DynamicFilterSet(FilterSet):
         
     def get_filters_options_json(self):
         return json.dumps(self.get_filters_as_options())
-    
+
+    @classmethod
+    def get_options_json(cls, prefix='1'):
+        """
+        Returns a ``(json, etag)`` pair with the options of an unbound
+        FilterSet of this class in the active language.  The payload is
+        rendered once and then served from the cache.
+        """
+        if cls.options_cache_timeout is None:
+            payload = cls(prefix=prefix).get_filters_options_json()
+            return payload, hashlib.md5(payload).hexdigest()
+        alias = cls.options_cache_alias
+        models = cls.get_options_models()
+        for model in models:
+            # lazy classes are only tracked once used
+            cache.track_model(model, alias)
+        parts = (cls.__module__, cls.__name__, cls.options_version,
+            get_language(), prefix,
+            tuple(cache.get_generation(model, alias) for model in models[1:]))
+        key = cache.make_key('options', models[0], parts, alias)
+        backend = cache.get_backend(alias)
+        value = backend.get(key)
+        if value is None:
+            payload = cls(prefix=prefix).get_filters_options_json()
+            value = payload, hashlib.md5(payload).hexdigest()
+            backend.set(key, value, cls.options_cache_timeout)
+        return value
+
+    @classmethod
+    def get_options_models(cls):
+        """
+        Returns the models the options are rendered from: the model of the
+        class and the models of the querysets of its filters.
+        """
+        models = [cls._meta.model]
+        for filter_ in cls.base_filters.itervalues():
+            filter_ = getattr(filter_, 'rel_filter', None) or filter_
+            queryset = filter_.extra.get('queryset')
+            if queryset is not None and queryset.model not in models:
+                models.append(queryset.model)
+        return models
+
     @property
     def dynamic_form(self):
         if not hasattr(self, '_dynamic_form'):
-            filter_fields = self.get_filters_as_options()
-            self.get_filters_options_json()
-            FILTER_CHOICES = sorted([('', '--------')]+[(name, field['label']) for name, field in filter_fields.iteritems()], key=lambda a: a[1])
+            # the fields of the form, so that the filters don't instantiate
+            # their own and the form class can still be reused
+            form_fields = self.form.fields
+            FILTER_CHOICES = sorted([('', '--------')]+[(name, form_fields[name].label or pretty_name(name)) for name in self.filters], key=lambda a: a[1])
             fields = [
                 ('select_field', forms.ChoiceField(choices=FILTER_CHOICES, required=False, label=_(u'Select field'))),
                 #~ (ORDER_BY_FIELD, self.ordering_field),
             ]
             if self.is_bound:
-                for name, filter_ in self.filters.iteritems():
+                for name in self.filters:
                     if name in self._form_fields:
-                        fields.append((name, filter_.field))
+                        fields.append((name, form_fields[name]))
             fields = SortedDict(fields)
             Form = type('DynamicForm', (forms.Form,), fields)
             if self.is_bound:
                 self._dynamic_form = Form(self.data, prefix=self.form_prefix)
                 self._dynamic_form.fields.insert(0, 'select_field', self._dynamic_form.fields['select_field'])
+                self._share_cleaned_data(self._dynamic_form)
             else:
                 self._dynamic_form = Form(prefix=self.form_prefix)
         return self._dynamic_form
     
+    def _share_cleaned_data(self, form):
+        # Validates the dynamic form with the values and errors of the filter
+        # fields cleaned by the FilterSet form, only select_field is cleaned.
+        cleaned_data = {}
+        errors = ErrorDict()
+        for name, field in form.fields.iteritems():
+            if name in self.errors:
+                errors[name] = self.errors[name]
+            elif name in self.cleaned_data:
+                cleaned_data[name] = self.cleaned_data[name]
+            else:
+                try:
+                    cleaned_data[name] = field.clean(form[name].data)
+                except forms.ValidationError, e:
+                    errors[name] = form.error_class(e.messages)
+        form._errors = errors
+        if not errors:
+            form.cleaned_data = cleaned_data
+
     @property
     def _form_fields(self):
         if not hasattr(self, '_ff'):
@@ -357,6 +1064,8 @@ class FilterSetGroup(object):
         self.queryset = queryset
         self._qs = None
         self._qsd = None
+        self._distinct = False
+        self._recorder = instrumentation.get_recorder(self)
         
         if self.data:
             iter_start = self.filterset_counter
@@ -386,28 +1095,105 @@ class FilterSetGroup(object):
     
     @property
     def base_qs(self):
-        if not self._qs:
-            qs = self.filtersets[0]._meta.model._default_manager.none()
-            for filterset in self.filtersets:
-                qs |= filterset.qs
-            if self.data.get(ORDER_BY_FIELD, None):
-                direction = self.data.get(ORDER_DIRECTION_FIELD, "")
-                if direction != "" and direction != '-':
-                    direction = ""
-                orderby_field = self.data.get(ORDER_BY_FIELD)
-                if orderby_field not in self.get_fields_names():
-                    orderby_field = "?"
-                    direction = ""
-                self._qs = qs.order_by(direction + self.data.get(ORDER_BY_FIELD))
+        if self._qs is None:
+            if self.queryset is None:
+                qs = self.filtersets[0]._meta.model._default_manager.all()
             else:
-                self._qs = qs
+                qs = self.queryset.all()
+            conditions = []
+            for filterset in self.filtersets:
+                q, multivalued = filterset._compile_q()
+                if not q:
+                    # this filterset matches every row
+                    conditions = []
+                    self._distinct = False
+                    break
+                conditions.append(q)
+                self._distinct = self._distinct or multivalued
+            if conditions:
+                qs = qs.filter(reduce(operator.or_, conditions))
+            ordering = self.get_ordering()
+            if ordering:
+                qs = qs.order_by(*ordering)
+            self._qs = qs
         return self._qs
+
+    def count(self, estimate_above=None):
+        """
+        Returns the number of distinct results, see ``BaseFilterSet.count``.
+        """
+        if not hasattr(self, '_count'):
+            if self._qsd is not None and query.is_fetched(self._qsd):
+                self._count = len(self._qsd)
+            else:
+                estimate = _estimate(self.base_qs, estimate_above)
+                if estimate is not None:
+                    return estimate
+                opts = self.filtersets[0]._meta
+                self._count = cached(opts, 'count', opts.count_cache_timeout,
+                    self.get_state(ordered=False), lambda: query.count(
+                        self.base_qs, distinct=self._distinct))
+        return self._count
+
+    def exists(self):
+        if hasattr(self, '_count'):
+            return self._count > 0
+        return query.exists(self.base_qs)
+
+    def aqs_list(self):
+        return concurrent.Deferred(list, self.qs)
+
+    def acount(self, estimate_above=None):
+        self.base_qs
+        return concurrent.Deferred(self.count, estimate_above)
+
+    def get_state(self, ordered=True):
+        state = (tuple(filterset.get_state(ordered)
+            for filterset in self.filtersets),)
+        if ordered:
+            state += (tuple(self.get_ordering()),)
+        return state
+
+    def get_ordering(self):
+        """
+        Returns the ``order_by()`` arguments for the ordering field and
+        direction in the data.
+        """
+        orderby_field = self.data.get(ORDER_BY_FIELD, None)
+        if not orderby_field:
+            return []
+        if orderby_field not in self.get_fields_names():
+            return []
+        direction = self.data.get(ORDER_DIRECTION_FIELD, "")
+        if direction != "" and direction != '-':
+            direction = ""
+        return [direction + orderby_field]
+
+    def iter_chunks(self, size=1000):
+        """
+        Iterates over the results in lists of at most ``size`` objects, see
+        ``BaseFilterSet.iter_chunks``.
+        """
+        return pagination.iter_chunks(self.qs, self.get_ordering(), size)
+
+    def stream(self, size=1000):
+        for chunk in self.iter_chunks(size):
+            for obj in chunk:
+                yield obj
+
+    def page(self, cursor=None, size=20):
+        return pagination.get_page(self.qs, self.get_ordering(), cursor, size)
     
     @property
     def qs(self):
-        if not self._qsd:
-            self._qsd = self.base_qs.distinct()
+        if self._qsd is None:
+            qs = self.base_qs
+            if self._distinct:
+                qs = qs.distinct()
+            if self._recorder is not None:
+                qs = instrumentation.instrument_queryset(qs, self._recorder)
+            self._qsd = qs
         return self._qsd
         
     def get_filters_as_options(self):
-        return self.filtersets[0].get_filters_options_json()
+        return self.filtersets[0].get_options_json()[0]
@@ -0,0 +1,258 @@
+"""
+Reports the lookups of a FilterSet that no database index can serve, and
+suggests the indexes to create for them.
+
+Every lookup needs a kind of index: ``exact`` or ``lt`` a plain B-tree,
+``istartswith`` a B-tree on ``UPPER(column)``, ``icontains`` a trigram index
+and so on.  The indexes of a table are the ones Django creates for its model
+(``db_index``, ``unique``, foreign keys) and, unless disabled, the ones found
+in the database itself.
+"""
+import re
+
+from django.db import connections, models, DEFAULT_DB_ALIAS
+from django.db.backends.util import truncate_name
+
+from django_filters.filterset import ORDER_BY_FIELD, get_model_field, uses_q
+
+# The kind of index each lookup type needs.  The other lookups extract a part
+# of the value, or negate the condition, which no index serves.
+LOOKUP_INDEXES = {
+    'exact': 'btree', 'in': 'btree', 'gt': 'btree', 'gte': 'btree',
+    'lt': 'btree', 'lte': 'btree', 'range': 'btree', 'isnull': 'btree',
+    'startswith': 'prefix', 'istartswith': 'iprefix', 'iexact': 'iexact',
+    'contains': 'trigram', 'endswith': 'trigram', 'regex': 'trigram',
+    'iregex': 'trigram', 'icontains': 'itrigram', 'iendswith': 'itrigram',
+    'search': 'fulltext',
+    # the ordering
+    'order_by': 'btree',
+}
+
+_BTREE = 'CREATE INDEX %(name)s ON %(table)s (%(column)s);'
+
+# For each database vendor and kind of index: the ``(method, expression)``
+# pairs of the existing indexes that serve it, the suffix of the suggested
+# index name and its definition.  Kinds a vendor doesn't list can't be served
+# by an index there.
+VENDOR_INDEXES = {
+    'postgresql': {
+        'btree': ([('btree', '%(column)s')], '', _BTREE),
+        'prefix': ([('btree', '%(column)s varchar_pattern_ops'),
+                    ('btree', '%(column)s text_pattern_ops')], '_like',
+            'CREATE INDEX %(name)s ON %(table)s (%(column)s %(pattern_ops)s);'),
+        'iexact': ([('btree', 'upper((%(column)s)::text)'),
+                    ('btree', 'upper((%(column)s)::text) text_pattern_ops')], '_upper',
+            'CREATE INDEX %(name)s ON %(table)s (UPPER(%(column)s::text));'),
+        'iprefix': ([('btree', 'upper((%(column)s)::text) text_pattern_ops')], '_upper_like',
+            'CREATE INDEX %(name)s ON %(table)s (UPPER(%(column)s::text) text_pattern_ops);'),
+        'trigram': ([('gin', '%(column)s gin_trgm_ops'),
+                     ('gist', '%(column)s gist_trgm_ops')], '_trgm',
+            'CREATE INDEX %(name)s ON %(table)s USING gin (%(column)s gin_trgm_ops);'),
+        'itrigram': ([('gin', 'upper((%(column)s)::text) gin_trgm_ops'),
+                      ('gist', 'upper((%(column)s)::text) gist_trgm_ops')], '_upper_trgm',
+            'CREATE INDEX %(name)s ON %(table)s USING gin (UPPER(%(column)s::text) gin_trgm_ops);'),
+    },
+    # the default collations are case insensitive
+    'mysql': {
+        'btree': ([('btree', '%(column)s')], '', _BTREE),
+        'prefix': ([('btree', '%(column)s')], '', _BTREE),
+        'iexact': ([('btree', '%(column)s')], '', _BTREE),
+        'iprefix': ([('btree', '%(column)s')], '', _BTREE),
+        'fulltext': ([('fulltext', '%(column)s')], '_fulltext',
+            'CREATE FULLTEXT INDEX %(name)s ON %(table)s (%(column)s);'),
+    },
+}
+DEFAULT_INDEXES = {
+    'btree': ([('btree', '%(column)s')], '', _BTREE),
+}
+
+# statements the suggested indexes of a kind depend on
+REQUIREMENTS = {
+    ('postgresql', 'trigram'): 'CREATE EXTENSION IF NOT EXISTS pg_trgm;',
+    ('postgresql', 'itrigram'): 'CREATE EXTENSION IF NOT EXISTS pg_trgm;',
+}
+
+def model_indexes(model, connection):
+    """
+    Returns the ``(method, expression)`` pairs of the indexes Django creates
+    for ``model``.  Only the first column of multi-column indexes is kept.
+    """
+    opts = model._meta
+    indexes = set()
+    for field in opts.local_fields:
+        if not (field.db_index or field.unique or field.primary_key):
+            continue
+        indexes.add(('btree', field.column))
+        if connection.vendor == 'postgresql' and field.db_index and not field.unique:
+            # see DatabaseCreation.sql_indexes_for_field
+            db_type = field.db_type(connection=connection) or ''
+            if db_type.startswith('varchar'):
+                indexes.add(('btree', '%s varchar_pattern_ops' % field.column))
+            elif db_type.startswith('text'):
+                indexes.add(('btree', '%s text_pattern_ops' % field.column))
+    for columns in opts.unique_together:
+        indexes.add(('btree', opts.get_field(columns[0]).column))
+    return indexes
+
+_indexdef_re = re.compile(r' USING (\w+) \((.*)\)$', re.I)
+
+def _first_expression(expressions):
+    depth = 0
+    for i, char in enumerate(expressions):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and not depth:
+            return expressions[:i].strip()
+    return expressions.strip()
+
+def database_indexes(table, connection):
+    """
+    Returns the ``(method, expression)`` pairs of the indexes of ``table``
+    found in the database.  Partial indexes are left out.
+    """
+    cursor = connection.cursor()
+    indexes = set()
+    if connection.vendor == 'postgresql':
+        cursor.execute('SELECT indexdef FROM pg_indexes WHERE tablename = %s', [table])
+        for definition, in cursor.fetchall():
+            match = _indexdef_re.search(definition.replace('"', ''))
+            if match is not None and ' WHERE ' not in definition.upper():
+                indexes.add((match.group(1).lower(),
+                    _first_expression(match.group(2)).lower()))
+    elif connection.vendor == 'sqlite':
+        qn = connection.ops.quote_name
+        cursor.execute('PRAGMA index_list(%s)' % qn(table))
+        for index in [row[1] for row in cursor.fetchall()]:
+            cursor.execute('PRAGMA index_info(%s)' % qn(index))
+            # seqno, cid, name
+            columns = sorted(cursor.fetchall())
+            if columns and columns[0][2] is not None:
+                indexes.add(('btree', columns[0][2]))
+    else:
+        for column in connection.introspection.get_indexes(cursor, table):
+            indexes.add(('btree', column))
+    return indexes
+
+def _index_name(table, column, suffix, connection):
+    return truncate_name('%s_%s%s' % (table, column, suffix),
+        connection.ops.max_name_length())
+
+def _check(entry, kind, field, indexes, connection):
+    vendor_indexes = VENDOR_INDEXES.get(connection.vendor, DEFAULT_INDEXES)
+    if kind not in vendor_indexes:
+        entry['note'] = 'no index serves %s lookups on %s' % (entry['lookup'],
+            connection.vendor)
+        return entry
+    served_by, suffix, definition = vendor_indexes[kind]
+    params = {'column': field.column.lower()}
+    entry['indexed'] = any((method, expression % params) in indexes
+        for method, expression in served_by)
+    if not entry['indexed']:
+        qn = connection.ops.quote_name
+        db_type = field.db_type(connection=connection) or ''
+        entry['sql'] = definition % {
+            'name': qn(_index_name(entry['table'], field.column, suffix, connection)),
+            'table': qn(entry['table']),
+            'column': qn(field.column),
+            'pattern_ops': db_type.startswith('text') and 'text_pattern_ops' or 'varchar_pattern_ops',
+        }
+        entry['requires'] = REQUIREMENTS.get((connection.vendor, kind))
+    return entry
+
+def advise(filterset_class, using=DEFAULT_DB_ALIAS, introspect=True):
+    """
+    Returns a dict for each lookup of each filter of ``filterset_class``, and
+    for each choice of its ordering, with the keys:
+
+    * ``filter``, ``path`` and ``lookup``: the filter (or ``o`` for the
+      ordering), the model field path it queries and the lookup type
+      (``order_by`` for the ordering).
+    * ``table`` and ``column``: where the path leads, ``None`` for relations
+      which are joined through the indexed foreign keys.
+    * ``indexed``: whether an index serves the lookup, ``None`` if that is
+      unknown: for paths that don't lead to a column of the table, and for
+      filters with a custom ``action`` or ``filter()`` (their ``path`` and
+      ``lookup`` are ``None``).
+    * ``sql`` and ``requires``: the suggested index, and the statement it
+      depends on, if any.
+    * ``note``: why no index can serve the lookup, or why it's unknown.
+
+    With ``introspect`` the indexes found in the ``using`` database are taken
+    into account, otherwise only the ones of the models.
+    """
+    connection = connections[using]
+    model = filterset_class._meta.model
+    table_indexes = {}
+    entries = []
+
+    def add(name, path, lookup):
+        entry = {'filter': name, 'path': path, 'lookup': lookup,
+            'table': None, 'column': None, 'indexed': False,
+            'sql': None, 'requires': None, 'note': None}
+        entries.append(entry)
+        return entry
+
+    def check(name, path, lookup):
+        entry = add(name, path, lookup)
+        field = get_model_field(model, path)
+        if isinstance(field, models.ManyToManyField):
+            entry['indexed'] = True
+            entry['note'] = 'joined through a foreign key'
+            return
+        if not isinstance(field, models.Field):
+            # a reverse relation, or a path that doesn't resolve
+            entry['indexed'] = None
+            entry['note'] = "the path doesn't lead to a column of the table"
+            return
+        entry['table'] = table = field.model._meta.db_table
+        entry['column'] = field.column
+        kind = LOOKUP_INDEXES.get(lookup)
+        if kind is None:
+            if lookup.startswith('ex_'):
+                entry['note'] = 'negated lookups match most of the table'
+            else:
+                entry['note'] = ('%s lookups extract a part of the value, '
+                    'filter on a range instead' % lookup)
+            return
+        if table not in table_indexes:
+            indexes = model_indexes(field.model, connection)
+            if introspect:
+                indexes |= database_indexes(table, connection)
+            table_indexes[table] = set((method, expression.lower())
+                for method, expression in indexes)
+        _check(entry, kind, field, table_indexes[table], connection)
+
+    for name, filter_ in filterset_class.base_filters.iteritems():
+        if not uses_q(filter_):
+            entry = add(name, None, None)
+            entry['indexed'] = None
+            entry['note'] = 'custom filtering, the lookups are unknown'
+            continue
+        for lookup in filter_.query_lookups():
+            check(name, filter_.query_name, lookup)
+    order_by = filterset_class._meta.order_by
+    if order_by:
+        if not isinstance(order_by, (list, tuple)):
+            order_by = filterset_class.base_filters.keys()
+        paths = []
+        for name in order_by:
+            # an index serves both directions
+            if name.lstrip('-') not in paths:
+                paths.append(name.lstrip('-'))
+        for path in paths:
+            check(ORDER_BY_FIELD, path, 'order_by')
+    return entries
+
+def suggestions(entries):
+    """
+    Returns the statements creating the indexes suggested in ``entries``, in
+    order and without duplicates.
+    """
+    statements = []
+    for entry in entries:
+        for statement in (entry['requires'], entry['sql']):
+            if statement and statement not in statements:
+                statements.append(statement)
+    return statements
@@ -0,0 +1,266 @@
+"""
+Instrumentation of FilterSets: the time spent building and validating the
+form, applying each filter, and compiling and running the SQL.
+
+Every measurement is sent with the ``timing`` signal and added to the
+``Stats`` of the ``collect()`` blocks active in the thread that created the
+FilterSet.  Nothing is measured unless the signal has receivers or a block is
+active, and then only for the fraction of FilterSets given by the
+``FILTERS_INSTRUMENTATION_SAMPLE_RATE`` setting (all of them by default).
+"""
+import copy_reg
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models.sql.constants import MULTI
+from django.dispatch import Signal
+
+timing = Signal(providing_args=['filterset', 'phase', 'name', 'duration',
+    'sql', 'params', 'rows'])
+
+_local = threading.local()
+
+class Stats(object):
+    """
+    Measurements aggregated per FilterSet class, phase and filter name.
+    ``data`` maps ``(label, phase, name)`` keys to ``[calls, seconds, rows]``.
+    """
+    def __init__(self):
+        self.data = {}
+        self._lock = threading.Lock()
+
+    def add(self, label, phase, name, duration, rows=None):
+        self._lock.acquire()
+        try:
+            entry = self.data.setdefault((label, phase, name), [0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += duration
+            entry[2] += rows or 0
+        finally:
+            self._lock.release()
+
+    def as_list(self):
+        """
+        Returns the measurements as a list of dicts, e.g. for a metrics
+        pipeline.
+        """
+        return [{
+            'filterset': label, 'phase': phase, 'name': name,
+            'calls': calls, 'seconds': seconds, 'rows': rows,
+        } for (label, phase, name), (calls, seconds, rows) in sorted(self.data.items())]
+
+    def total(self, phase, label=None):
+        """
+        Returns the seconds spent in ``phase``, for the FilterSet class
+        ``label`` or for all of them.
+        """
+        return sum(seconds for (l, p, n), (calls, seconds, rows) in self.data.items()
+            if p == phase and label in (None, l))
+
+@contextmanager
+def collect():
+    """
+    Aggregates the measurements of the FilterSets created in the block::
+
+        with instrumentation.collect() as stats:
+            response = view(request)
+        send_metrics(stats.as_list())
+    """
+    stats = Stats()
+    collectors = getattr(_local, 'collectors', None)
+    if collectors is None:
+        collectors = _local.collectors = []
+    collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        collectors.remove(stats)
+
+class Recorder(object):
+    def __init__(self, filterset, label, collectors):
+        self.filterset = filterset
+        self.label = label
+        self.collectors = collectors
+
+    def record(self, phase, name, duration, sql=None, params=None, rows=None):
+        for stats in self.collectors:
+            stats.add(self.label, phase, name, duration, rows)
+        timing.send(sender=self.filterset.__class__, filterset=self.filterset,
+            phase=phase, name=name, duration=duration, sql=sql, params=params,
+            rows=rows)
+
+def get_recorder(filterset):
+    """
+    Returns the ``Recorder`` measuring ``filterset``, or None if it isn't
+    instrumented.
+    """
+    collectors = list(getattr(_local, 'collectors', ()))
+    if not collectors and not timing.receivers:
+        return None
+    rate = getattr(settings, 'FILTERS_INSTRUMENTATION_SAMPLE_RATE', 1)
+    if rate < 1 and random.random() >= rate:
+        return None
+    cls = filterset.__class__
+    return Recorder(filterset, '%s.%s' % (cls.__module__, cls.__name__), collectors)
+
+class QueryTimer(object):
+    """
+    The time spent compiling and executing one query, and its SQL.
+    """
+    def __init__(self):
+        self.compile = 0.0
+        self.execute = 0.0
+        self.sql = None
+        self.params = ()
+
+def _timed_chunks(chunks, timer):
+    # Times the fetching of each chunk of rows, but not their use.
+    while True:
+        start = time.time()
+        try:
+            chunk = chunks.next()
+        except StopIteration:
+            return
+        finally:
+            timer.execute += time.time() - start
+        yield chunk
+
+class InstrumentedCompiler(object):
+    """
+    Mixed into the class of the compiler of an ``InstrumentedQuery``, times
+    the compilation of the SQL and its execution on the cursor.
+    """
+    timer = None
+
+    def as_sql(self, *args, **kwargs):
+        start = time.time()
+        try:
+            self.timer.sql, self.timer.params = result = super(
+                InstrumentedCompiler, self).as_sql(*args, **kwargs)
+        finally:
+            self.timer.compile += time.time() - start
+        return result
+
+    def execute_sql(self, result_type=MULTI):
+        start, compiling = time.time(), self.timer.compile
+        try:
+            result = super(InstrumentedCompiler, self).execute_sql(result_type)
+        finally:
+            # as_sql() is called, and timed, within execute_sql()
+            self.timer.execute += (time.time() - start
+                - (self.timer.compile - compiling))
+        if result_type == MULTI and not isinstance(result, list):
+            result = _timed_chunks(result, self.timer)
+        return result
+
+class InstrumentedQuery(object):
+    """
+    Mixed into the class of the query of an instrumented queryset while its
+    results are fetched, so that its compiler reports to ``timer``.
+    """
+    timer = None
+
+    def get_compiler(self, using=None, connection=None):
+        compiler = super(InstrumentedQuery, self).get_compiler(using, connection)
+        if self.timer is None:
+            return compiler
+        klass = instrumented_class(InstrumentedCompiler, compiler.__class__)
+        compiler = klass(self, compiler.connection, compiler.using)
+        compiler.timer = self.timer
+        return compiler
+
+    def __reduce__(self):
+        return _reduce_to_base(self, InstrumentedQuery)
+
+class InstrumentedQuerySet(object):
+    """
+    Mixed into the class of the querysets of instrumented FilterSets, times
+    the compilation and the execution of their queries.
+    """
+    recorder = None
+
+    def _clone(self, klass=None, setup=False, **kwargs):
+        kwargs.setdefault('recorder', self.recorder)
+        return super(InstrumentedQuerySet, self)._clone(klass, setup, **kwargs)
+
+    def __getstate__(self):
+        # the recorder refers to the FilterSet, it isn't pickled
+        state = super(InstrumentedQuerySet, self).__getstate__()
+        state.pop('recorder', None)
+        return state
+
+    def __reduce__(self):
+        return _reduce_to_base(self, InstrumentedQuerySet)
+
+    def iterator(self):
+        if self.recorder is None:
+            for obj in super(InstrumentedQuerySet, self).iterator():
+                yield obj
+            return
+        timer = QueryTimer()
+        clone = self._clone()
+        clone.query = self.query.clone(klass=instrumented_class(
+            InstrumentedQuery, self.query.__class__), timer=timer)
+        rows = 0
+        try:
+            for obj in super(InstrumentedQuerySet, clone).iterator():
+                rows += 1
+                yield obj
+        finally:
+            self.recorder.record('compile', None, timer.compile)
+            self.recorder.record('execute', 'results', timer.execute,
+                timer.sql, timer.params, rows)
+
+    def count(self):
+        if self.recorder is None or (self._result_cache is not None
+            and not self._iter):
+            return super(InstrumentedQuerySet, self).count()
+        start = time.time()
+        count = super(InstrumentedQuerySet, self).count()
+        self.recorder.record('execute', 'count', time.time() - start, rows=1)
+        return count
+
+    def exists(self):
+        if self.recorder is None or (self._result_cache is not None
+            and not self._iter):
+            return super(InstrumentedQuerySet, self).exists()
+        start = time.time()
+        exists = super(InstrumentedQuerySet, self).exists()
+        self.recorder.record('execute', 'exists', time.time() - start, rows=1)
+        return exists
+
+_classes = {}
+_classes_lock = threading.Lock()
+
+def instrumented_class(mixin, base):
+    """
+    Returns the subclass of ``base`` with ``mixin``, created once per class.
+    """
+    try:
+        return _classes[mixin, base]
+    except KeyError:
+        pass
+    _classes_lock.acquire()
+    try:
+        if (mixin, base) not in _classes:
+            _classes[mixin, base] = type('Instrumented%s' % base.__name__,
+                (mixin, base), {})
+        return _classes[mixin, base]
+    finally:
+        _classes_lock.release()
+
+def _reduce_to_base(obj, mixin):
+    # Pickles obj as an instance of the class it was instrumented from: the
+    # instrumented classes only exist in the process that created them.
+    base = [klass for klass in obj.__class__.__bases__ if klass is not mixin][0]
+    return copy_reg._reconstructor, (base, object, None), obj.__getstate__()
+
+def instrument_queryset(queryset, recorder):
+    """
+    Returns a copy of ``queryset`` whose queries are measured by ``recorder``.
+    """
+    klass = instrumented_class(InstrumentedQuerySet, queryset.__class__)
+    return queryset._clone(klass=klass, recorder=recorder)
@@ -0,0 +1,49 @@
+from optparse import make_option
+
+from django.core.management.base import LabelCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.importlib import import_module
+
+from django_filters import indexes
+
+class Command(LabelCommand):
+    help = ("Reports the lookups of the given FilterSet classes that no index "
+        "serves, and prints the CREATE INDEX statements to add.")
+    args = "<module.FilterSet ...>"
+    label = 'FilterSet class'
+
+    option_list = LabelCommand.option_list + (
+        make_option('--database', action='store', dest='database',
+            default=DEFAULT_DB_ALIAS, help='Nominates the database whose '
+                'indexes are checked. Defaults to the "default" database.'),
+        make_option('--no-introspect', action='store_false', dest='introspect',
+            default=True, help='Only consider the indexes declared by the '
+                'models, without querying the database.'),
+        make_option('--all', action='store_true', dest='all', default=False,
+            help='Also list the lookups an index already serves.'),
+    )
+
+    def handle_label(self, label, **options):
+        module_name, _, class_name = label.rpartition('.')
+        try:
+            filterset_class = getattr(import_module(module_name), class_name)
+        except (ImportError, AttributeError, ValueError):
+            raise CommandError("Can't import %r." % label)
+
+        entries = indexes.advise(filterset_class, options.get('database'),
+            options.get('introspect'))
+        output = ['-- %s' % label]
+        for entry in entries:
+            if entry['indexed'] and not options.get('all'):
+                continue
+            if entry['path'] is None:
+                line = '--   %(filter)s' % entry
+            else:
+                line = '--   %(filter)s: %(path)s %(lookup)s' % entry
+            if entry['indexed']:
+                line += ' (indexed)'
+            elif entry['note']:
+                line += ' (%s)' % entry['note']
+            output.append(line)
+        output.extend(indexes.suggestions(entries))
+        return '\n'.join(output) + '\n'
@@ -0,0 +1,36 @@
+from optparse import make_option
+
+from django.core.management.base import LabelCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.importlib import import_module
+
+from django_filters.filters import SearchFilter
+
+class Command(LabelCommand):
+    help = ("Creates what the SearchFilters of the given FilterSet classes "
+        "need in the database, like the FTS5 tables on SQLite.")
+    args = "<module.FilterSet ...>"
+    label = 'FilterSet class'
+
+    option_list = LabelCommand.option_list + (
+        make_option('--database', action='store', dest='database',
+            default=DEFAULT_DB_ALIAS, help='Nominates the database to install '
+                'the search into. Defaults to the "default" database.'),
+    )
+
+    def handle_label(self, label, **options):
+        module_name, _, class_name = label.rpartition('.')
+        try:
+            filterset_class = getattr(import_module(module_name), class_name)
+        except (ImportError, AttributeError, ValueError):
+            raise CommandError("Can't import %r." % label)
+
+        output = []
+        for name, filter_ in filterset_class.base_filters.iteritems():
+            if not isinstance(filter_, SearchFilter):
+                continue
+            created = filter_.install(filterset_class._meta.model,
+                options.get('database', DEFAULT_DB_ALIAS))
+            output.append('%s.%s: %s' % (label, name,
+                created and 'installed' or 'already installed'))
+        return '\n'.join(output) + '\n'
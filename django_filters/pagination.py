@@ -0,0 +1,224 @@
+"""
+Keyset (seek) pagination over the querysets of FilterSets.
+
+Instead of ``OFFSET`` the next rows are selected with a condition on the
+ordering key of the last row seen, with the primary key as a tie breaker, so
+every page costs the same however deep it is.
+"""
+import base64
+import json
+import operator
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from django.db.models.fields import FieldDoesNotExist
+from django.db.models.sql.constants import LOOKUP_SEP
+from django.utils.encoding import force_unicode
+
+def keyset_terms(ordering):
+    """
+    Returns the ``(name, descending)`` pairs the keyset is built from for an
+    ``order_by()`` list.  The primary key is appended as a tie breaker, random
+    ordering is ignored.
+    """
+    terms = []
+    for name in ordering:
+        if name == '?':
+            continue
+        if name.startswith('-'):
+            terms.append((name[1:], True))
+        else:
+            terms.append((name, False))
+    if terms and terms[-1][0] == 'pk':
+        return terms
+    descending = terms and terms[-1][1] or False
+    return terms + [('pk', descending)]
+
+def _nulls_largest(queryset):
+    # whether the database sorts NULL after every other value
+    return connections[queryset.db].vendor in ('postgresql', 'oracle')
+
+def after_q(terms, values, nulls_largest=False):
+    """
+    Returns the ``Q`` object selecting the rows that come after ``values`` in
+    the order given by ``terms``.
+    """
+    conditions = []
+    for i, (name, descending) in enumerate(terms):
+        value = values[i]
+        nulls_first = nulls_largest == descending
+        if value is None:
+            if not nulls_first:
+                # NULL is the last possible value
+                continue
+            after = Q(**{'%s__isnull' % name: False})
+        else:
+            after = Q(**{'%s__%s' % (name, descending and 'lt' or 'gt'): value})
+            if not nulls_first:
+                after |= Q(**{'%s__isnull' % name: True})
+        for j, (prev_name, _) in enumerate(terms[:i]):
+            if values[j] is None:
+                after &= Q(**{'%s__isnull' % prev_name: True})
+            else:
+                after &= Q(**{prev_name: values[j]})
+        conditions.append(after)
+    if not conditions:
+        return None
+    return reduce(operator.or_, conditions)
+
+def _attnames(model, names):
+    # Returns the attribute holding the value of every name, or None if one
+    # of them isn't a local column of the model.
+    attnames = []
+    for name in names:
+        if name == 'pk':
+            attnames.append(model._meta.pk.attname)
+            continue
+        if LOOKUP_SEP in name:
+            return None
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if field.rel:
+            return None
+        attnames.append(field.attname)
+    return attnames
+
+def order_by_terms(queryset, terms):
+    return queryset.order_by(*[(descending and '-' or '') + name
+        for name, descending in terms])
+
+def fetch(queryset, terms, values, size):
+    """
+    Returns the objects of ``queryset`` ordered by ``terms`` that come after
+    ``values`` (all of them if it's None), at most ``size`` of them, and the
+    keyset values of each object.
+    """
+    queryset = order_by_terms(queryset, terms)
+    if values is not None:
+        condition = after_q(terms, values, _nulls_largest(queryset))
+        if condition is None:
+            return [], []
+        queryset = queryset.filter(condition)
+    names = [name for name, descending in terms]
+    attnames = _attnames(queryset.model, names)
+    if attnames is not None:
+        objs = list(queryset[:size])
+        keys = [[getattr(obj, attname) for attname in attnames] for obj in objs]
+        return objs, keys
+    # the ordering spans relations, read the keys with values_list() and
+    # fetch the objects by primary key
+    rows = list(queryset.values_list(*names)[:size])
+    if not rows:
+        return [], []
+    objs = queryset.in_bulk([row[-1] for row in rows])
+    rows = [row for row in rows if row[-1] in objs]
+    return [objs[row[-1]] for row in rows], [list(row) for row in rows]
+
+def iter_chunks(queryset, ordering, size=1000):
+    """
+    Iterates over ``queryset`` ordered by ``ordering`` in lists of at most
+    ``size`` objects.  Each list is fetched with its own query, so only one
+    chunk is held in memory at a time.
+    """
+    terms = keyset_terms(ordering)
+    values = None
+    while True:
+        objs, keys = fetch(queryset, terms, values, size)
+        if not objs:
+            return
+        yield objs
+        if len(objs) < size:
+            return
+        values = keys[-1]
+
+def iter_value_chunks(queryset, ordering, fields, size=1000):
+    """
+    Iterates over the values of ``fields`` in the rows of ``queryset``
+    ordered by ``ordering``, in lists of at most ``size`` tuples.  The rows
+    are read with ``values_list()``, no model instance is created.
+    """
+    terms = keyset_terms(ordering)
+    queryset = order_by_terms(queryset, terms)
+    nulls_largest = _nulls_largest(queryset)
+    columns = list(fields) + [name for name, descending in terms]
+    width = len(fields)
+    values = None
+    while True:
+        qs = queryset
+        if values is not None:
+            condition = after_q(terms, values, nulls_largest)
+            if condition is None:
+                return
+            qs = qs.filter(condition)
+        rows = list(qs.values_list(*columns)[:size])
+        if not rows:
+            return
+        yield [row[:width] for row in rows]
+        if len(rows) < size:
+            return
+        values = list(rows[-1][width:])
+
+def encode_cursor(ordering, values):
+    """
+    Returns an opaque cursor pointing after the row with the keyset
+    ``values`` for ``ordering``.
+    """
+    data = json.dumps([list(ordering), values], default=force_unicode)
+    return base64.urlsafe_b64encode(data).rstrip('=')
+
+def decode_cursor(cursor, ordering):
+    """
+    Returns the keyset values stored in ``cursor``, or None if it's not a
+    valid cursor for ``ordering``.
+    """
+    try:
+        data = base64.urlsafe_b64decode(str(cursor) + '=' * (-len(cursor) % 4))
+        cursor_ordering, values = json.loads(data)
+    except (TypeError, ValueError, UnicodeError):
+        return None
+    if cursor_ordering != list(ordering) or not isinstance(values, list):
+        return None
+    if len(values) != len(keyset_terms(ordering)):
+        return None
+    return values
+
+class Page(object):
+    """
+    A page of results.  ``next_cursor`` is the cursor of the following page,
+    or None if this is the last one.
+    """
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+def get_page(queryset, ordering, cursor=None, size=20):
+    """
+    Returns the ``Page`` of ``size`` objects following ``cursor``, or the
+    first page if ``cursor`` is None or invalid.
+    """
+    terms = keyset_terms(ordering)
+    values = None
+    if cursor:
+        values = decode_cursor(cursor, ordering)
+    try:
+        objs, keys = fetch(queryset, terms, values, size + 1)
+    except (ValueError, ValidationError):
+        # the cursor holds values that don't fit the ordering fields
+        objs, keys = fetch(queryset, terms, None, size + 1)
+    next_cursor = None
+    if len(objs) > size:
+        objs = objs[:size]
+        next_cursor = encode_cursor(ordering, keys[size - 1])
+    return Page(objs, next_cursor)
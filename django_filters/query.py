@@ -0,0 +1,48 @@
+"""
+Helpers running the cheapest SQL for questions about a filtered queryset.
+"""
+import re
+
+from django.db import connections
+from django.db.models import Count
+
+_rows_re = re.compile(r'rows=(\d+)')
+
+def is_fetched(queryset):
+    """
+    Returns True if every result of ``queryset`` has been fetched, a queryset
+    that is being iterated (possibly in another thread) is not.
+    """
+    return queryset._result_cache is not None and not queryset._iter
+
+def estimate_count(queryset):
+    """
+    Returns the number of rows the query planner expects ``queryset`` to
+    return, or None if the database doesn't provide an estimate.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    cursor = connection.cursor()
+    cursor.execute('EXPLAIN ' + sql, params)
+    match = _rows_re.search(cursor.fetchone()[0])
+    if match is None:
+        return None
+    return int(match.group(1))
+
+def count(queryset, distinct=False):
+    """
+    Counts the rows of ``queryset`` without its ordering.  With ``distinct``
+    the primary keys are counted with ``COUNT(DISTINCT)``.
+    """
+    queryset = queryset.order_by()
+    if distinct:
+        return queryset.aggregate(count=Count('pk', distinct=True))['count']
+    return queryset.count()
+
+def exists(queryset):
+    """
+    Returns True if ``queryset`` has any row, without its ordering.
+    """
+    return queryset.order_by().exists()
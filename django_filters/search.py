@@ -0,0 +1,225 @@
+"""
+Full-text search backends of ``SearchFilter``.
+
+A backend turns the search terms into a condition on the primary key of the
+model, answered by the full-text index of the database, and optionally into a
+relevance score to order the results by.  What a backend needs in the
+database is created by ``install()``, see the ``search_index`` management
+command; searching never changes the schema.
+"""
+from django.db.backends.util import truncate_name
+from django.db.models import Q
+
+class Subquery(object):
+    """
+    A raw SQL query selecting primary keys, usable as the value of a
+    ``pk__in`` lookup.
+    """
+    def __init__(self, sql, params):
+        self.sql = sql
+        self.params = params
+
+    def prepare(self):
+        return self
+
+    def as_sql(self):
+        return self.sql, self.params
+
+def get_columns(model, fields):
+    return [model._meta.get_field(name).column for name in fields]
+
+class SearchBackend(object):
+    """
+    Matches every term in any of the fields with ``icontains``, for databases
+    without full-text search.  No index serves it.
+    """
+    # the ``order_by()`` argument of the relevance score
+    rank_order = None
+
+    def install(self, model, fields, connection):
+        """
+        Creates what the backend needs to search ``fields`` of ``model``.
+        Returns True if anything was created.
+        """
+        return False
+
+    def search(self, queryset, fields, terms, connection, rank=False):
+        """
+        Returns ``queryset`` restricted to the rows matching every term in
+        ``fields``, ordered by relevance with ``rank``.
+        """
+        queryset = queryset.filter(self.get_q(queryset.model, fields, terms,
+            connection))
+        if rank and self.rank_order:
+            sql, params = self.get_rank(queryset.model, fields, terms, connection)
+            queryset = queryset.extra(select={'search_rank': sql},
+                select_params=params, order_by=[self.rank_order])
+        return queryset
+
+    def get_q(self, model, fields, terms, connection):
+        q = Q()
+        for term in terms:
+            q &= reduce(lambda a, b: a | b,
+                [Q(**{'%s__icontains' % name: term}) for name in fields])
+        return q
+
+    def get_rank(self, model, fields, terms, connection):
+        """
+        Returns the ``(sql, params)`` of the relevance score of a row, or
+        ``None``.
+        """
+        return None
+
+class SQLiteSearch(SearchBackend):
+    """
+    Searches an FTS5 table shadowing the columns of the model.  The table
+    reads its content from the model table and triggers keep it in sync, so
+    rows changed by ``update()`` or outside of Django are found too.
+    """
+    # bm25() is lower for better matches
+    rank_order = 'search_rank'
+
+    def get_table(self, model, fields, connection):
+        return truncate_name('%s_%s_fts' % (model._meta.db_table,
+            '_'.join(get_columns(model, fields))), connection.ops.max_name_length())
+
+    def install(self, model, fields, connection):
+        qn = connection.ops.quote_name
+        fts = self.get_table(model, fields, connection)
+        cursor = connection.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [fts])
+        if cursor.fetchone() is not None:
+            return False
+        columns = get_columns(model, fields)
+        params = {
+            'fts': qn(fts),
+            'table': qn(model._meta.db_table),
+            'content': model._meta.db_table,
+            'pk': qn(model._meta.pk.column),
+            'content_rowid': model._meta.pk.column,
+            'columns': ', '.join([qn(c) for c in columns]),
+            'new': ', '.join(['new.%s' % qn(c) for c in columns]),
+            'old': ', '.join(['old.%s' % qn(c) for c in columns]),
+            'insert': qn('%s_insert' % fts),
+            'delete': qn('%s_delete' % fts),
+            'update': qn('%s_update' % fts),
+        }
+        for statement in [
+            "CREATE VIRTUAL TABLE %(fts)s USING fts5(%(columns)s, "
+                "content='%(content)s', content_rowid='%(content_rowid)s')",
+            "CREATE TRIGGER %(insert)s AFTER INSERT ON %(table)s BEGIN "
+                "INSERT INTO %(fts)s(rowid, %(columns)s) VALUES (new.%(pk)s, %(new)s); END",
+            "CREATE TRIGGER %(delete)s AFTER DELETE ON %(table)s BEGIN "
+                "INSERT INTO %(fts)s(%(fts)s, rowid, %(columns)s) "
+                "VALUES ('delete', old.%(pk)s, %(old)s); END",
+            "CREATE TRIGGER %(update)s AFTER UPDATE ON %(table)s BEGIN "
+                "INSERT INTO %(fts)s(%(fts)s, rowid, %(columns)s) "
+                "VALUES ('delete', old.%(pk)s, %(old)s); "
+                "INSERT INTO %(fts)s(rowid, %(columns)s) VALUES (new.%(pk)s, %(new)s); END",
+            # index the existing rows
+            "INSERT INTO %(fts)s(%(fts)s) VALUES ('rebuild')"]:
+            cursor.execute(statement % params)
+        return True
+
+    def get_match(self, terms):
+        # every term as a string, so the FTS5 query syntax isn't interpreted
+        return ' '.join(['"%s"' % term.replace('"', '""') for term in terms])
+
+    def get_q(self, model, fields, terms, connection):
+        fts = connection.ops.quote_name(self.get_table(model, fields, connection))
+        return Q(pk__in=Subquery('SELECT rowid FROM %s WHERE %s MATCH %%s' % (fts, fts),
+            [self.get_match(terms)]))
+
+    def search(self, queryset, fields, terms, connection, rank=False):
+        if not rank:
+            return super(SQLiteSearch, self).search(queryset, fields, terms,
+                connection)
+        # The rank of a row is only known to the query running the MATCH, so
+        # the FTS table is joined once rather than matched again per row.
+        qn = connection.ops.quote_name
+        model = queryset.model
+        table = self.get_table(model, fields, connection)
+        return queryset.extra(select={'search_rank': '%s.rank' % qn(table)},
+            tables=[table], where=[
+                '%s.rowid = %s.%s' % (qn(table), qn(model._meta.db_table),
+                    qn(model._meta.pk.column)),
+                '%s MATCH %%s' % qn(table)],
+            params=[self.get_match(terms)], order_by=[self.rank_order])
+
+class PostgreSQLSearch(SearchBackend):
+    """
+    Matches a ``tsvector`` of the fields against the terms.  Create a GIN
+    index on the same expression for the search to use it, see
+    ``get_document()``.
+    """
+    rank_order = '-search_rank'
+
+    def __init__(self, config='english'):
+        self.config = config
+
+    def get_document(self, model, fields, connection):
+        """
+        Returns the ``tsvector`` expression searched for ``fields``.
+        """
+        qn = connection.ops.quote_name
+        columns = " || ' ' || ".join(["coalesce(%s, '')" % qn(c)
+            for c in get_columns(model, fields)])
+        return "to_tsvector('%s', %s)" % (self.config.replace("'", "''"), columns)
+
+    def get_query(self, terms):
+        return "plainto_tsquery('%s', %%s)" % self.config.replace("'", "''")
+
+    def get_q(self, model, fields, terms, connection):
+        qn = connection.ops.quote_name
+        return Q(pk__in=Subquery('SELECT %s FROM %s WHERE %s @@ %s' % (
+            qn(model._meta.pk.column), qn(model._meta.db_table),
+            self.get_document(model, fields, connection), self.get_query(terms)),
+            [' '.join(terms)]))
+
+    def get_rank(self, model, fields, terms, connection):
+        return ('ts_rank(%s, %s)' % (self.get_document(model, fields, connection),
+            self.get_query(terms)), [' '.join(terms)])
+
+class MySQLSearch(SearchBackend):
+    """
+    Matches the terms in boolean mode, which needs a ``FULLTEXT`` index on
+    the fields.
+    """
+    rank_order = '-search_rank'
+
+    def get_match(self, model, fields, connection):
+        qn = connection.ops.quote_name
+        return 'MATCH (%s) AGAINST (%%s IN BOOLEAN MODE)' % ', '.join(
+            ['%s.%s' % (qn(model._meta.db_table), qn(c)) for c in get_columns(model, fields)])
+
+    def get_terms(self, terms):
+        # every term is required, the operators are left out
+        return ' '.join(['+"%s"' % term.replace('"', '') for term in terms])
+
+    def get_q(self, model, fields, terms, connection):
+        qn = connection.ops.quote_name
+        return Q(pk__in=Subquery('SELECT %s FROM %s WHERE %s' % (
+            qn(model._meta.pk.column), qn(model._meta.db_table),
+            self.get_match(model, fields, connection)), [self.get_terms(terms)]))
+
+    def get_rank(self, model, fields, terms, connection):
+        return self.get_match(model, fields, connection), [self.get_terms(terms)]
+
+BACKENDS = {
+    'sqlite': SQLiteSearch,
+    'postgresql': PostgreSQLSearch,
+    'mysql': MySQLSearch,
+}
+
+_backends = {}
+
+def get_backend(connection):
+    """
+    Returns the default search backend for the vendor of ``connection``.
+    """
+    try:
+        return _backends[connection.vendor]
+    except KeyError:
+        backend = _backends[connection.vendor] = BACKENDS.get(connection.vendor,
+            SearchBackend)()
+        return backend
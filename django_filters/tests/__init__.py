@@ -1,7 +1,13 @@
-from tests import (GenericViewTests, InheritanceTest, ModelInheritanceTest,
-    DateRangeFilterTest, FilterSetForm, AllValuesFilterTest, InitialValueTest,
-    RelatedObjectTest, MultipleChoiceFilterTest, MultipleLookupTypesTest, 
-    filter_tests)
+from tests import (GenericViewTests, RemoteChoicesTest, FilterOptionsTest,
+    InheritanceTest, ModelInheritanceTest, DateRangeFilterTest,
+    FilterSetInstanceTest, FilterForFieldTest, LazyFilterSetTest,
+    ThreadSafetyTest, FilterSetForm, FormClassCacheTest, FilterPlanTest,
+    FilterSetGroupTest, StreamTest, KeysetPaginationTest, CountTest,
+    FacetTest, LinkWidgetTest, ResultCacheTest, ValidationTest, ExportTest,
+    ConcurrentTest, InstrumentationTest, IndexAdvisorTest, SearchFilterTest,
+    AllValuesFilterTest, AllValuesFilterCacheTest,
+    InitialValueTest, RelatedObjectTest, MultipleChoiceFilterTest,
+    MultipleLookupTypesTest, filter_tests)
 
 __test__ = {
     'filter_tests': filter_tests,
@@ -0,0 +1,363 @@
+"""
+Micro-benchmarks for django-filter.
+
+These need the same setup as the test suite (``django_filters.tests`` in
+``INSTALLED_APPS``) and can be run with::
+
+    python -m django_filters.tests.benchmarks [--rows=N] [--save=FILE] [--compare=FILE]
+
+The benchmarks run against a test database which is filled with ``--rows``
+synthetic users, comments and articles.  ``--save`` stores the results as
+JSON, and ``--compare`` prints the change of every result relative to a file
+stored with ``--save``, e.g. by the previous release.  Benchmarks that fail,
+like the ones of features an older version lacks, are skipped.
+
+``benchmark_baseline.json`` next to this module holds the results of this
+suite for the code before the performance work, measured with the default
+``--rows``.  Timings depend on the machine, compare against a baseline saved
+on the same one.
+"""
+import datetime
+import gc
+import json
+import random
+import time
+from optparse import OptionParser
+
+from django.db import connection, transaction
+from django.http import QueryDict
+from django.test.client import RequestFactory
+
+import django_filters
+from django_filters.filterset import FilterSetGroup
+from django_filters.tests.models import User, Comment, Book, Article
+from django_filters.widgets import LinkWidget
+
+
+def measure(func, number=1000):
+    """
+    Calls ``func`` ``number`` times and returns a ``(seconds, retained)`` pair
+    with the time taken and the number of objects retained by a single call.
+
+    Python 2 can't count allocations: ``retained`` is the number of objects
+    tracked by the garbage collector (containers, not ints or strings) that
+    are still alive after the call returned and its result was dropped.  The
+    collector is disabled while measuring, so this includes the reference
+    cycles a call leaves for it to free, along with what it keeps in caches.
+    """
+    gc.collect()
+    gc.disable()
+    try:
+        before = len(gc.get_objects())
+        start = time.time()
+        for i in xrange(number):
+            func()
+        elapsed = time.time() - start
+        after = len(gc.get_objects())
+    finally:
+        gc.enable()
+    return elapsed / number, (after - before) / float(number)
+
+
+def insert(model, columns, rows, batch_size=10000):
+    """
+    Inserts ``rows``, tuples of values for the fields named in ``columns``,
+    in the table of ``model`` with ``executemany()``.
+    """
+    opts = model._meta
+    fields = [opts.get_field(name) for name in columns]
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (qn(opts.db_table),
+        ', '.join(qn(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)))
+    cursor = connection.cursor()
+    batch = []
+    for row in rows:
+        batch.append([field.get_db_prep_save(value, connection)
+            for field, value in zip(fields, row)])
+        if len(batch) >= batch_size:
+            cursor.executemany(sql, batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+
+
+def create_data(rows, books=50, books_per_user=5, seed=0):
+    """
+    Fills the empty database with ``rows`` users, each having
+    ``books_per_user`` favorite books out of ``books``, ``rows`` comments and
+    ``rows / 2`` articles.  The rows are generated lazily and inserted in
+    batches, so 10^6 users fit in SQLite.
+    """
+    rnd = random.Random(seed)
+    names = ['alex', 'aaron', 'jacob', 'zoe', 'mia', 'noah']
+    day = datetime.date(2010, 1, 1)
+    insert(Book, ['id', 'title', 'price', 'average_rating'],
+        ((i, 'Book %d' % i, i % 100, rnd.random() * 5) for i in xrange(1, books + 1)))
+    insert(User, ['id', 'username', 'first_name', 'last_name', 'status', 'is_active'],
+        ((i, '%s%d' % (rnd.choice(names), i), '', '', i % 2, bool(i % 3))
+            for i in xrange(1, rows + 1)))
+    insert(User.favorite_books.through, ['user', 'book'],
+        ((user_id, book_id) for user_id in xrange(1, rows + 1)
+            for book_id in rnd.sample(xrange(1, books + 1), books_per_user)))
+    insert(Comment, ['text', 'author', 'date', 'time'],
+        (('comment %d' % i, rnd.randint(1, rows),
+            day + datetime.timedelta(days=i % 1000),
+            datetime.time(i % 24, i % 60)) for i in xrange(rows)))
+    insert(Article, ['author', 'published'],
+        ((i % 10 and rnd.randint(1, rows) or None,
+            datetime.datetime(2010, 1, 1) + datetime.timedelta(hours=i))
+            for i in xrange(rows // 2)))
+    transaction.commit_unless_managed()
+
+
+def query_plan(qs):
+    sql, params = qs.query.sql_with_params()
+    if connection.vendor == 'sqlite':
+        sql = 'EXPLAIN QUERY PLAN ' + sql
+    else:
+        sql = 'EXPLAIN ' + sql
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    return [' '.join(unicode(c) for c in row) for row in cursor.fetchall()]
+
+
+def timed(func, number=5):
+    start = time.time()
+    for i in xrange(number):
+        func()
+    return (time.time() - start) / number
+
+
+class UserFilterSet(django_filters.FilterSet):
+    class Meta:
+        model = User
+
+
+class CommentFilterSet(django_filters.FilterSet):
+    class Meta:
+        model = Comment
+
+
+class BookFilterSet(django_filters.FilterSet):
+    class Meta:
+        model = Book
+
+
+class JoinFilterSet(django_filters.FilterSet):
+    class Meta:
+        model = User
+        fields = ['username', 'status', 'favorite_books']
+
+
+class SubqueryFilterSet(JoinFilterSet):
+    class Meta(JoinFilterSet.Meta):
+        use_subqueries = True
+
+
+class ArticleFilterSet(django_filters.FilterSet):
+    class Meta:
+        model = Article
+
+
+MODEL_FILTERSETS = (UserFilterSet, CommentFilterSet, BookFilterSet, ArticleFilterSet)
+
+
+def result(seconds, **extra):
+    extra['seconds'] = seconds
+    return extra
+
+
+def measured(func, number=1000):
+    seconds, retained = measure(func, number)
+    return result(seconds, retained=retained)
+
+
+def bench_class_creation():
+    def create(model):
+        meta = type('Meta', (object,), {'model': model})
+        return type('%sFilterSet' % model.__name__, (django_filters.FilterSet,),
+            {'Meta': meta, '__module__': __name__})
+    return dict(
+        (model.__name__, measured(lambda: create(model), 200))
+        for model in (User, Comment, Book, Article)
+    )
+
+
+def bench_filterset_init():
+    return dict(
+        (F.__name__, measured(lambda: F({})))
+        for F in MODEL_FILTERSETS
+    )
+
+
+def bench_form():
+    return dict(
+        (F.__name__, measured(lambda: F({}).form))
+        for F in MODEL_FILTERSETS
+    )
+
+
+class LinkFilterSet(django_filters.FilterSet):
+    status = django_filters.ChoiceFilter(widget=LinkWidget,
+        choices=[(0, 'Regular'), (1, 'Admin')])
+    is_active = django_filters.BooleanFilter()
+    class Meta:
+        model = User
+        fields = ['username', 'status', 'is_active']
+
+
+def bench_form_render():
+    # the related models of the other filtersets have as many rows as users
+    return dict(
+        (F.__name__, measured(lambda: unicode(F({'status': '1'}).form), 100))
+        for F in (BookFilterSet, JoinFilterSet, LinkFilterSet)
+    )
+
+
+def bench_qs_sql():
+    cases = (
+        (UserFilterSet, {'username': 'zoe1', 'status': '1', 'is_active': '2'}),
+        (CommentFilterSet, {'text': 'comment 1', 'date': '2010-01-01'}),
+        (BookFilterSet, {'price': '10', 'average_rating': '2.5'}),
+        (ArticleFilterSet, {'published': '2010-01-01 10:00'}),
+    )
+    return dict(
+        (F.__name__, measured(lambda: str(F(data).qs.query)))
+        for F, data in cases
+    )
+
+
+def bench_group_or():
+    results = {}
+    for groups in (1, 5, 20):
+        data = {'group-total-forms': str(groups)}
+        for i in xrange(1, groups + 1):
+            data['%d-username' % i] = 'zoe%d' % i
+            data['%d-status' % i] = str(i % 2)
+        results['%3d groups' % groups] = measured(
+            lambda: str(FilterSetGroup(UserFilterSet, data).qs.query), 200)
+    return results
+
+
+def bench_link_widget():
+    data = QueryDict('status=1&username=zoe1&o=username')
+    results = {}
+    for choices in (5, 50):
+        widget = LinkWidget(choices=[(i, 'Choice %d' % i) for i in xrange(choices)])
+        widget.value_from_datadict(data, {}, 'choice')
+        results['%3d choices' % choices] = measured(
+            lambda: widget.render('choice', '3'))
+    return results
+
+
+def bench_group_subqueries():
+    book_ids = [str(pk) for pk in Book.objects.values_list('pk', flat=True)[:3]]
+    data = {
+        'group-total-forms': '3',
+        '1-favorite_books': book_ids,
+        '2-status': '1',
+        '3-username': 'zoe1',
+    }
+    results = {}
+    for F in (JoinFilterSet, SubqueryFilterSet):
+        qs = FilterSetGroup(F, data).qs
+        results[F.__name__] = result(timed(lambda: list(qs.all())),
+            plan=query_plan(qs))
+    return results
+
+
+def bench_export():
+    from django_filters.views import object_export
+
+    request = RequestFactory().get('/export/', {'status': '1'})
+    fields = ['id', 'username', 'status', 'is_active']
+    rows = User.objects.filter(status=1).count()
+    results = {}
+    for format in ('csv', 'ndjson'):
+        seconds = timed(lambda: ''.join(object_export(request,
+            filter_class=UserFilterSet, fields=fields, format=format)))
+        results[format] = result(seconds, rows=rows)
+    return results
+
+
+BENCHMARKS = (
+    ('FilterSet class creation', bench_class_creation),
+    ('FilterSet construction', bench_filterset_init),
+    ('FilterSet.form construction', bench_form),
+    ('FilterSet.form rendering', bench_form_render),
+    ('FilterSet.qs SQL compilation', bench_qs_sql),
+    ('FilterSetGroup with OR groups', bench_group_or),
+    ('LinkWidget rendering', bench_link_widget),
+    ('FilterSetGroup joins vs. subqueries', bench_group_subqueries),
+    ('object_export throughput', bench_export),
+)
+
+
+def format_seconds(seconds):
+    if seconds < 1e-3:
+        return '%8.1f us' % (seconds * 1e6)
+    return '%8.1f ms' % (seconds * 1e3)
+
+
+def report(name, result, baseline=None):
+    line = '    %-20s %s' % (name, format_seconds(result['seconds']))
+    if 'retained' in result:
+        line += ' %8.1f retained objects' % result['retained']
+    if 'rows' in result:
+        line += ' %10.0f rows/s' % (result['rows'] / result['seconds'])
+    if baseline is not None:
+        line += ' %+7.1f%%' % ((result['seconds'] / baseline['seconds'] - 1) * 100)
+        if 'retained' in result and 'retained' in baseline:
+            line += ' %+8.1f retained' % (result['retained'] - baseline['retained'])
+    print line
+    for plan_line in result.get('plan', ()):
+        print '        %s' % plan_line
+
+
+def run(rows=10000, save=None, compare=None):
+    from django.test.simple import DjangoTestSuiteRunner
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    baselines = {}
+    if compare:
+        stored = json.load(open(compare))
+        if stored['rows'] != rows:
+            print 'The baseline was measured with %d rows' % stored['rows']
+        baselines = stored['results']
+    results = {}
+    setup_test_environment()
+    runner = DjangoTestSuiteRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        create_data(rows)
+        for title, bench in BENCHMARKS:
+            print title
+            try:
+                results[title] = bench()
+            except Exception, e:
+                # e.g. a feature the measured version doesn't have
+                print '    skipped: %s: %s' % (e.__class__.__name__, e)
+                continue
+            for name, result in sorted(results[title].items()):
+                report(name, result, baselines.get(title, {}).get(name))
+    finally:
+        runner.teardown_databases(old_config)
+        teardown_test_environment()
+    if save:
+        for title in results:
+            for result in results[title].values():
+                result.pop('plan', None)
+        json.dump({'rows': rows, 'results': results}, open(save, 'w'), indent=2)
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('--rows', type='int', default=10000,
+        help='number of synthetic users to create')
+    parser.add_option('--save', metavar='FILE',
+        help='store the results in FILE')
+    parser.add_option('--compare', metavar='FILE',
+        help='compare the results with the ones stored in FILE')
+    options, args = parser.parse_args()
+    run(options.rows, options.save, options.compare)
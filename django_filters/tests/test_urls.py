@@ -1,7 +1,27 @@
 from django.conf.urls.defaults import *
 
-from django_filters.tests.models import Book
+import django_filters
+from django_filters.tests.models import Book, User
+
+class UserFilterSet(django_filters.FilterSet):
+    favorite_books = django_filters.ModelMultipleChoiceFilter(
+        queryset=Book.objects.all(), remote_url='/users/choices/favorite_books/',
+        search_field='title')
+    class Meta:
+        model = User
+        fields = ['username', 'favorite_books']
+
+class UserDynamicFilterSet(django_filters.DynamicFilterSet):
+    options_cache_timeout = 60
+
+    class Meta:
+        model = User
+        fields = ['username', 'status', 'favorite_books']
 
 urlpatterns = patterns('',
     (r'^books/$', 'django_filters.views.object_filter', {'model': Book}),
+    (r'^users/choices/(?P<field_name>\w+)/$', 'django_filters.views.object_choices',
+        {'filter_class': UserFilterSet, 'page_size': 2}),
+    (r'^users/options/$', 'django_filters.views.filter_options',
+        {'filter_class': UserDynamicFilterSet}),
 )
@@ -1,10 +1,29 @@
+import copy
 import datetime
+import json
 import os
+import pickle
+from StringIO import StringIO
+import re
+import threading
+import time
 
+from django import forms
 from django.conf import settings
-from django.test import TestCase
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, models
+from django.db.models.query import QuerySet
+from django.http import Http404, QueryDict
+from django.test import TestCase, TransactionTestCase
+from django.test.client import RequestFactory
 
 import django_filters
+from django_filters import cache, concurrent, indexes, instrumentation, query, search
+from django_filters.filterset import FilterSetGroup, LazyFilters, \
+    get_filter_data, get_model_field, is_multivalued, uses_q, _lazy_classes
+from django_filters.views import object_choices, object_export
+from django_filters.widgets import LinkWidget
 from django_filters.tests.models import User, Comment, Book, Restaurant, Article, STATUS_CHOICES
 
 
@@ -27,6 +46,99 @@ class GenericViewTests(TestCase):
         for b in ['Ender&#39;s Game', 'Rainbox Six', 'Snowcrash']:
             self.assertContains(response, b)
 
+class RemoteChoicesTest(TestCase):
+    urls = 'django_filters.tests.test_urls'
+    fixtures = ['test_data']
+
+    def test_widget(self):
+        from django_filters.tests.test_urls import UserFilterSet
+        html = unicode(UserFilterSet({'favorite_books': ['2']}).form['favorite_books'])
+        self.assertTrue('data-remote-url="/users/choices/favorite_books/"' in html)
+        self.assertTrue('Rainbox Six' in html)
+        self.assertFalse('Snowcrash' in html)
+        f = UserFilterSet({'favorite_books': ['2']})
+        self.assertEqual([u.username for u in f.qs], ['alex'])
+
+    def test_choices_view(self):
+        response = self.client.get('/users/choices/favorite_books/')
+        data = json.loads(response.content)
+        self.assertEqual(data['results'], [
+            {'id': '1', 'text': "Ender's Game"}, {'id': '2', 'text': 'Rainbox Six'}])
+        self.assertTrue(data['more'])
+        response = self.client.get('/users/choices/favorite_books/',
+            {'after': data['after']})
+        data = json.loads(response.content)
+        self.assertEqual(data['results'], [{'id': '3', 'text': 'Snowcrash'}])
+        self.assertFalse(data['more'])
+        response = self.client.get('/users/choices/favorite_books/', {'q': 'sn'})
+        self.assertEqual(json.loads(response.content)['results'],
+            [{'id': '3', 'text': 'Snowcrash'}])
+        from django_filters.tests.test_urls import UserFilterSet
+        request = RequestFactory().get('/users/choices/username/')
+        self.assertRaises(Http404, object_choices, request, 'username',
+            filter_class=UserFilterSet)
+
+        class F(django_filters.FilterSet):
+            author = django_filters.RelatedObjectFilter('author__username')
+            class Meta:
+                model = Comment
+                fields = ['author', 'date']
+        for name in ('author', 'date', 'missing'):
+            self.assertRaises(Http404, object_choices, request, name,
+                filter_class=F)
+
+
+class FilterOptionsTest(TestCase):
+    urls = 'django_filters.tests.test_urls'
+    fixtures = ['test_data']
+
+    def setUp(self):
+        cache.get_backend().clear()
+
+    def test_cached_payload(self):
+        from django_filters.tests.test_urls import UserDynamicFilterSet
+        payload, etag = UserDynamicFilterSet.get_options_json()
+        options = json.loads(payload)
+        self.assertEqual(set(options), set(['username', 'status', 'favorite_books']))
+        self.assertTrue('name="1-username"' in options['username']['widget'])
+        with self.assertNumQueries(0):
+            self.assertEqual(UserDynamicFilterSet.get_options_json(), (payload, etag))
+
+        group = FilterSetGroup(UserDynamicFilterSet, {'group-total-forms': '1',
+            '1-username': 'alex'})
+        self.assertEqual(group.get_filters_as_options(), payload)
+        form = group.filtersets[0].dynamic_form
+        self.assertEqual(form.fields.keys(), ['select_field', 'username'])
+        self.assertEqual([c[0] for c in form.fields['select_field'].choices],
+            ['', 'favorite_books', 'status', 'username'])
+
+    def test_invalidated(self):
+        from django_filters.tests.test_urls import UserDynamicFilterSet
+        payload, etag = UserDynamicFilterSet.get_options_json()
+        Book.objects.create(title="Dune", price='1.00', average_rating=4.0)
+        new_payload, new_etag = UserDynamicFilterSet.get_options_json()
+        self.assertNotEqual(new_etag, etag)
+        self.assertTrue('Dune' in json.loads(new_payload)['favorite_books']['widget'])
+
+    def test_not_cached(self):
+        class F(django_filters.DynamicFilterSet):
+            class Meta:
+                model = User
+                fields = ['favorite_books']
+
+        payload, etag = F.get_options_json()
+        with self.assertNumQueries(1):
+            self.assertEqual(F.get_options_json(), (payload, etag))
+
+    def test_view(self):
+        response = self.client.get('/users/options/')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response['Vary'], 'Accept-Language')
+        etag = response['ETag']
+        response = self.client.get('/users/options/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
 class InheritanceTest(TestCase):
     def test_inheritance(self):
         class F(django_filters.FilterSet):
@@ -63,6 +175,272 @@ class DateRangeFilterTest(TestCase):
         f = F({'published': '2'})
         self.assertEqual(list(f), [a])
 
+    def test_ranges(self):
+        f = django_filters.DateRangeFilter(name='published')
+        f._now = datetime.datetime(2012, 11, 30, 15, 30)
+        day = datetime.datetime
+        self.assertEqual(f.get_bounds('1'), (day(2012, 11, 30), day(2012, 12, 1)))
+        self.assertEqual(f.get_bounds('2'), (day(2012, 11, 23), day(2012, 12, 1)))
+        self.assertEqual(f.get_bounds('3'), (day(2012, 11, 1), day(2012, 12, 1)))
+        self.assertEqual(f.get_bounds('4'), (day(2012, 1, 1), day(2013, 1, 1)))
+        self.assertEqual(f.get_bounds(''), None)
+        self.assertEqual(f.get_bounds('9'), None)
+        # the bounds are compared with the column itself
+        sql = str(Article.objects.filter(f.get_q('3')).query)
+        self.assertTrue('"published" >= 2012-11-01' in sql, sql)
+        self.assertTrue('"published" < 2012-12-01' in sql, sql)
+        self.assertFalse('django_extract' in sql, sql)
+
+    def test_options(self):
+        f = django_filters.DateRangeFilter(name='published', options=[
+            ('', ('Any', None)),
+            (1, ('Past 24 hours', django_filters.filters.past(hours=24))),
+            (2, ('This quarter', django_filters.filters.this_quarter)),
+        ])
+        self.assertEqual([c[0] for c in f.field.choices], ['', 1, 2])
+        f._now = datetime.datetime(2012, 11, 30, 15, 30)
+        self.assertEqual(f.get_bounds('1'), (datetime.datetime(2012, 11, 29, 15, 30), None))
+        self.assertEqual(f.get_bounds('2'),
+            (datetime.datetime(2012, 10, 1), datetime.datetime(2013, 1, 1)))
+        self.assertEqual(f.get_q('1').children,
+            [('published__gte', datetime.datetime(2012, 11, 29, 15, 30))])
+
+    def test_now_read_once(self):
+        f = django_filters.DateRangeFilter(name='published')
+        f.get_bounds('1')
+        now = f._now
+        f.get_bounds('3')
+        self.assertTrue(f._now is now)
+        # every FilterSet reads the time again
+        self.assertFalse(hasattr(copy.copy(f), '_now'))
+
+    def test_time_zone(self):
+        with self.settings(USE_TZ=True):
+            start, end = django_filters.DateRangeFilter().get_bounds('1')
+        self.assertFalse(start.tzinfo is None)
+        self.assertEqual(end - start, datetime.timedelta(days=1))
+
+    def test_custom_keys(self):
+        def this_quarter(now):
+            start = datetime.datetime(now.year, (now.month - 1) // 3 * 3 + 1, 1)
+            return start, None
+        f = django_filters.DateRangeFilter(options=[('', ('Any', None)),
+            ('quarter', ('This quarter', this_quarter))])
+        start, end = f.get_bounds('quarter')
+        self.assertEqual(start.day, 1)
+        self.assertEqual(end, None)
+        self.assertEqual(f.get_bounds(''), None)
+        self.assertEqual(f.get_bounds('1'), None)
+        self.assertEqual(f.get_bounds(None), None)
+        self.assertEqual(django_filters.DateRangeFilter().get_bounds(None), None)
+
+    def test_queryset_options(self):
+        # options of the former API filter the queryset themselves
+        class LegacyDateRangeFilter(django_filters.DateRangeFilter):
+            options = {
+                '': ('Any Date', lambda qs, name: qs.all()),
+                1: ('2010', lambda qs, name: qs.filter(**{'%s__year' % name: 2010})),
+                2: ('This month', django_filters.filters.this_month),
+            }
+        class F(django_filters.FilterSet):
+            published = LegacyDateRangeFilter()
+            class Meta:
+                model = Article
+                fields = ['published']
+        Article.objects.create(published=datetime.datetime(2010, 3, 1))
+        Article.objects.create(published=datetime.datetime.now())
+        self.assertFalse(uses_q(F().filters['published']))
+        self.assertEqual(F({'published': '1'}).qs.count(), 1)
+        self.assertEqual(F({'published': '2'}).qs.count(), 1)
+        self.assertEqual(F({'published': ''}).qs.count(), 2)
+
+
+class FilterSetInstanceTest(TestCase):
+    def test_filters_are_isolated(self):
+        class F(django_filters.FilterSet):
+            class Meta:
+                model = Comment
+                fields = ['author']
+        f, g = F(), F()
+        f.filters['author'].extra.update({'empty_label': u'All authors'})
+        self.assertFalse('empty_label' in g.filters['author'].extra)
+        self.assertFalse('empty_label' in F.base_filters['author'].extra)
+        self.assertEqual(f.filters['author'].model, Comment)
+        self.assertTrue(f.filters['author'].field is not g.filters['author'].field)
+
+    def test_definition_is_shared(self):
+        class F(django_filters.FilterSet):
+            class Meta:
+                model = Comment
+                fields = ['author']
+        f = F()
+        self.assertTrue(f.filters['author'].extra['queryset']
+            is F.base_filters['author'].extra['queryset'])
+
+
+class FilterForFieldTest(TestCase):
+    def test_subclass(self):
+        class LowerCaseField(models.CharField):
+            pass
+        f = django_filters.FilterSet.filter_for_field(
+            LowerCaseField(verbose_name='code'), 'code')
+        self.assertTrue(isinstance(f, django_filters.CharFilter))
+        self.assertEqual(get_filter_data(LowerCaseField, {}),
+            get_filter_data(models.CharField, {}))
+        self.assertEqual(django_filters.FilterSet.filter_for_field(
+            models.AutoField(verbose_name='id', primary_key=True), 'id'), None)
+
+    def test_overrides(self):
+        class F(django_filters.FilterSet):
+            filter_overrides = {
+                models.CharField: {
+                    'filter_class': django_filters.AllValuesFilter,
+                },
+            }
+        f = F.filter_for_field(models.TextField(verbose_name='text'), 'text')
+        self.assertTrue(isinstance(f, django_filters.CharFilter))
+        # the closest registered class wins over the overrides of its bases
+        f = F.filter_for_field(models.SlugField(verbose_name='slug'), 'slug')
+        self.assertEqual(f.__class__, django_filters.CharFilter)
+        f = F.filter_for_field(models.CharField(verbose_name='name'), 'name')
+        self.assertTrue(isinstance(f, django_filters.AllValuesFilter))
+
+    def test_model_field(self):
+        field = get_model_field(Article, 'author__username')
+        self.assertEqual(field, User._meta.get_field('username'))
+        self.assertTrue(get_model_field(Article, 'author__username') is field)
+        self.assertEqual(get_model_field(Article, 'author__nothing'), None)
+
+
+class LazyFilterSetTest(TestCase):
+    fixtures = ['test_data']
+
+    def test_lazy(self):
+        class F(django_filters.FilterSet):
+            class Meta:
+                model = User
+                fields = ['username']
+                lazy = True
+        self.assertTrue(isinstance(F.__dict__['base_filters'], LazyFilters))
+        self.assertEqual([u.username for u in F({'username': 'alex'})], ['alex'])
+        self.assertEqual(F.__dict__['base_filters'].keys(), ['username'])
+
+    def test_threads(self):
+        class F(django_filters.FilterSet):
+            class Meta:
+                model = User
+                fields = ['username', 'status']
+                lazy = True
+        results = []
+        def access():
+            results.append(F.base_filters)
+        threads = [threading.Thread(target=access) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(filters is results[0] for filters in results))
+
+    def test_errors(self):
+        class F(django_filters.FilterSet):
+            class Meta:
+                model = User
+                fields = ['nothing']
+                lazy = True
+        try:
+            self.assertRaises(TypeError, django_filters.warmup)
+            self.assertRaises(TypeError, F)
+        finally:
+            _lazy_classes.remove(F)
+
+    def test_warmup(self):
+        class F(django_filters.FilterSet):
+            class Meta:
+                model = User
+                fields = ['username']
+                lazy = True
+        django_filters.warmup()
+        self.assertEqual(F.__dict__['base_filters'].keys(), ['username'])
+
+
+def run_concurrently(func, args_list, threads=8):
+    """
+    Calls ``func(*args)`` for every tuple of ``args_list`` from ``threads``
+    threads started together, and returns the results in the same order.
+    """
+    results = [None] * len(args_list)
+    errors = []
+    start = threading.Event()
+    def worker(indexes):
+        start.wait()
+        for i in indexes:
+            try:
+                results[i] = func(*args_list[i])
+            except Exception, e:
+                errors.append(e)
+    workers = [threading.Thread(target=worker,
+        args=(range(i, len(args_list), threads),)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.set()
+    for thread in workers:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+class ThreadSafetyTest(TestCase):
+    cases = [None, {}, {'text': 'a', 'o': 'date'},
+        {'author': 'alex', 'date': '4'}, {'text': 'x', 'o': '-date'},
+        {'date': 'bad', 'author': 'jacob'}]
+
+    def get_filterset_classes(self):
+        class F(django_filters.FilterSet):
+            author = django_filters.RelatedObjectFilter('author__username')
+            date = django_filters.DateRangeFilter()
+            class Meta:
+                model = Comment
+                fields = ['text', 'author', 'date']
+                order_by = ['date', '-date']
+                lazy = True
+
+        class G(F):
+            filter_overrides = {
+                models.CharField: {
+                    'filter_class': django_filters.NumberFilter,
+                },
+            }
+            class Meta(F.Meta):
+                pass
+        return F, G
+
+    def describe(self, filterset_class, data):
+        f = filterset_class(data)
+        return (f.form.as_p(), str(f.qs.query), sorted(f.errors.keys()),
+            f.get_state())
+
+    def test_stress(self):
+        F, G = self.get_filterset_classes()
+        args_list = [(filterset_class, data) for filterset_class in (F, G)
+            for data in self.cases] * 20
+        results = run_concurrently(self.describe, args_list, threads=16)
+
+        F, G = self.get_filterset_classes()
+        expected = [self.describe(*args) for args in args_list]
+        self.assertEqual(results, expected)
+
+    def test_subclass_subfilters(self):
+        F, G = self.get_filterset_classes()
+        self.assertEqual(G.base_filters['author'].rel_filter.__class__,
+            django_filters.NumberFilter)
+        self.assertEqual(F.base_filters['author'].rel_filter.__class__,
+            django_filters.CharFilter)
+        self.assertEqual(G.base_filters['author'].rel_filter.__class__,
+            django_filters.NumberFilter)
+        self.assertEqual(F.declared_filters['author'].rel_filter, None)
+
 
 class FilterSetForm(TestCase):
     def test_prefix(self):
@@ -72,6 +450,908 @@ class FilterSetForm(TestCase):
                 fields = ['name']
         self.assert_('blah-prefix' in unicode(F(prefix='blah-prefix').form))
 
+class FormClassCacheTest(TestCase):
+    fixtures = ['test_data']
+
+    def test_form_class_is_reused(self):
+        class F(django_filters.FilterSet):
+            class Meta:
+                model = User
+                fields = ['username', 'status']
+                order_by = ['status']
+        self.assertTrue(F().form.__class__ is F({'status': '1'}).form.__class__)
+        self.assertEqual(F().form.fields.keys(), ['username', 'status', 'o'])
+
+    def test_modified_filters(self):
+        class F(django_filters.FilterSet):
+            class Meta:
+                model = Comment
+                fields = ['author']
+        f = F()
+        f.filters['author'].extra.update({'empty_label': u'All authors'})
+        self.assertTrue(f.form.__class__ is not F().form.__class__)
+        self.assertTrue(u'All authors' in unicode(f.form))
+        self.assertFalse(u'All authors' in unicode(F().form))
+
+    def test_modified_field(self):
+        class F(django_filters.FilterSet):
+            class Meta:
+                model = Comment
+                fields = ['author']
+        f = F()
+        f.filters['author'].field.queryset = User.objects.filter(username='alex')
+        f.filters['author'].field.label = u'Written by'
+        html = unicode(f.form)
+        self.assertTrue(u'Written by' in html)
+        self.assertTrue(u'>alex<' in html)
+        self.assertFalse(u'>jacob<' in html)
+        self.assertTrue(u'>jacob<' in unicode(F().form))
+
+    def test_dynamic_form_first(self):
+        class F(django_filters.DynamicFilterSet):
+            class Meta:
+                model = User
+                fields = ['username', 'status']
+        data = {'group-total-forms': '1', '1-username': 'alex'}
+        classes = set()
+        for i in range(3):
+            f = FilterSetGroup(F, data).filtersets[0]
+            self.assertEqual(f.dynamic_form.fields.keys(),
+                ['select_field', 'username'])
+            classes.add(f.form.__class__)
+        self.assertEqual(len(classes), 1)
+        self.assertEqual(f.dynamic_form.fields['select_field'].choices,
+            [('', '--------'), ('status', 'Status'), ('username', 'Username')])
+
+    def test_dynamic_field(self):
+        class F(django_filters.FilterSet):
+            username = django_filters.AllValuesFilter()
+            class Meta:
+                model = User
+                fields = ['username']
+        self.assertFalse(u'zoe' in unicode(F().form))
+        User.objects.create(username='zoe', status=0)
+        self.assertTrue(u'zoe' in unicode(F().form))
+
+
+class FilterPlanTest(TestCase):
+    fixtures = ['test_data']
+
+    def test_get_lookup(self):
+        f = django_filters.CharFilter(name='username')
+        self.assertEqual(f.get_lookup('exact'), ('username__exact', False))
+        self.assertEqual(f.get_lookup('ex_startswith'), ('username__startswith', True))
+        self.assertTrue(copy.copy(f)._lookups is f._lookups)
+
+    def test_is_multivalued(self):
+        self.assertTrue(is_multivalued(User, 'favorite_books'))
+        self.assertTrue(is_multivalued(User, 'comment__text'))
+        self.assertFalse(is_multivalued(Comment, 'author__username'))
+        self.assertFalse(is_multivalued(Article, 'published__year'))
+
+    def test_combined_filters(self):
+        class F(django_filters.FilterSet):
+            username = django_filters.CharFilter(lookup_type=['exact', 'ex_exact'])
+            class Meta:
+                model = User
+                fields = ['username', 'status', 'is_active']
+        f = F({'username_0': 'ex_exact', 'username_1': 'alex', 'status': '0',
+            'is_active': '2'})
+        self.assertEqual(list(f.qs), [User.objects.get(username='jacob')])
+
+    def test_custom_filter_methods(self):
+        class StartsWithFilter(django_filters.CharFilter):
+            def filter(self, qs, value):
+                if value:
+                    return qs.filter(username__startswith=value)
+                return qs
+        class F(django_filters.FilterSet):
+            username = StartsWithFilter()
+            status = django_filters.NumberFilter(
+                action=lambda qs, value: qs.exclude(status=value) if value is not None else qs)
+            class Meta:
+                model = User
+                fields = ['username', 'status']
+        self.assertFalse(uses_q(F.base_filters['username']))
+        self.assertFalse(uses_q(F.base_filters['status']))
+        self.assertEqual(list(F({'username': 'a', 'status': '1'}).qs),
+            [User.objects.get(username='aaron')])
+
+
+class FilterSetGroupTest(TestCase):
+    fixtures = ['test_data']
+
+    class F(django_filters.FilterSet):
+        class Meta:
+            model = User
+            fields = ['username', 'status', 'favorite_books']
+
+    def test_or_groups(self):
+        group = FilterSetGroup(self.F, {'group-total-forms': '2',
+            '1-username': 'alex', '2-status': '0'})
+        self.assertEqual(set(group), set(User.objects.all()))
+        self.assertFalse(group.qs.query.distinct)
+
+        group = FilterSetGroup(self.F, {'group-total-forms': '2',
+            '1-username': 'alex', '2-username': 'jacob'})
+        self.assertEqual(set(u.username for u in group), set(['alex', 'jacob']))
+
+    def test_multivalued_relation(self):
+        group = FilterSetGroup(self.F, {'group-total-forms': '2',
+            '1-favorite_books': ['1', '2'], '2-username': 'jacob'})
+        self.assertTrue(group.qs.query.distinct)
+        self.assertEqual(sorted(u.username for u in group),
+            ['aaron', 'alex', 'jacob'])
+
+    def test_several_multivalued_filters(self):
+        class F(django_filters.FilterSet):
+            title = django_filters.CharFilter(name='favorite_books__title')
+            price = django_filters.NumberFilter(name='favorite_books__price')
+            class Meta:
+                model = User
+                fields = ['title', 'price']
+        data = {'title': "Ender's Game", 'price': '15'}
+        self.assertEqual([u.username for u in F(data)], ['alex'])
+        group = FilterSetGroup(F, {'group-total-forms': '1',
+            '1-title': "Ender's Game", '1-price': '15'})
+        self.assertEqual([u.username for u in group], ['alex'])
+
+    def test_subqueries(self):
+        class F(django_filters.FilterSet):
+            class Meta:
+                model = User
+                fields = ['username', 'favorite_books']
+                use_subqueries = True
+        self.assertEqual(sorted(u.username for u in F({'favorite_books': ['1', '2']})),
+            ['aaron', 'alex'])
+        group = FilterSetGroup(F, {'group-total-forms': '2',
+            '1-favorite_books': ['1', '2'], '2-username': 'jacob'})
+        self.assertFalse(group.qs.query.distinct)
+        self.assertEqual(sorted(u.username for u in group),
+            ['aaron', 'alex', 'jacob'])
+
+    def test_custom_action(self):
+        class F(django_filters.FilterSet):
+            username = django_filters.CharFilter(
+                action=lambda qs, value: qs.filter(username__startswith=value) if value else qs)
+            class Meta:
+                model = User
+                fields = ['username', 'status']
+        group = FilterSetGroup(F, {'group-total-forms': '2',
+            '1-username': 'a', '1-status': '1', '2-username': 'j'})
+        self.assertEqual(sorted(u.username for u in group), ['alex', 'jacob'])
+
+    def test_ordering(self):
+        group = FilterSetGroup(self.F, {'group-total-forms': '1',
+            'o': 'username', 'sort_direction': '-'})
+        self.assertEqual(group.get_ordering(), ['-username'])
+        group = FilterSetGroup(self.F, {'group-total-forms': '1',
+            'o': 'password'})
+        self.assertEqual(group.get_ordering(), [])
+
+
+class StreamTest(TestCase):
+    fixtures = ['test_data']
+
+    def test_stream(self):
+        class F(django_filters.FilterSet):
+            class Meta:
+                model = User
+                fields = ['username', 'status']
+                order_by = ['status', 'username']
+        f = F({'o': 'status'})
+        self.assertEqual([len(chunk) for chunk in f.iter_chunks(2)], [2, 1])
+        self.assertEqual([u.username for u in f.stream(1)],
+            ['aaron', 'jacob', 'alex'])
+        self.assertEqual([u.username for u in F({'status': '0'}).stream(1)],
+            ['aaron', 'jacob'])
+        with self.assertNumQueries(2):
+            list(F({'o': 'username'}).stream(3))
+
+    def test_related_ordering(self):
+        Article.objects.create(published=datetime.datetime(2010, 1, 1))
+        class F(django_filters.FilterSet):
+            class Meta:
+                model = Article
+                fields = ['author__username']
+                order_by = ['author__username']
+        f = F({'o': 'author__username'})
+        self.assertEqual([a.pk for a in f.stream(1)], [a.pk for a in f.qs])
+
+    def test_group(self):
+        class F(django_filters.FilterSet):
+            class Meta:
+                model = User
+                fields = ['username', 'status', 'favorite_books']
+        group = FilterSetGroup(F, {'group-total-forms': '2',
+            '1-favorite_books': ['1', '2'], '2-username': 'jacob',
+            'o': 'status', 'sort_direction': '-'})
+        self.assertEqual([u.username for u in group.stream(1)],
+            ['alex', 'jacob', 'aaron'])
+        self.assertEqual(sorted(u.pk for u in group.stream(2)),
+            sorted(u.pk for u in group))
+
+
+class KeysetPaginationTest(TestCase):
+    fixtures = ['test_data']
+
+    class F(django_filters.FilterSet):
+        class Meta:
+            model = Article
+            fields = ['author']
+            order_by = ['published', 'author__username']
+
+    def test_pages(self):
+        for pk, author in ((4, None), (5, 1), (6, 3)):
+            Article.objects.create(pk=pk, author_id=author,
+                published=datetime.datetime(2010, 7, 8))
+        for ordering in ('published', 'author__username'):
+            f = self.F({'o': ordering})
+            pks, cursor = [], None
+            while True:
+                page = f.page(cursor, 2)
+                self.assertTrue(len(page) <= 2)
+                pks.extend(a.pk for a in page)
+                if not page.has_next():
+                    break
+                cursor = page.next_cursor
+            self.assertEqual(pks, [a.pk for a in f.qs.order_by(ordering, 'pk')])
+
+    def test_invalid_cursor(self):
+        f = self.F({'o': 'published'})
+        first = [a.pk for a in f.page(None, 2)]
+        self.assertEqual([a.pk for a in f.page('garbage', 2)], first)
+        cursor = f.page(None, 2).next_cursor
+        self.assertEqual([a.pk for a in self.F({}).page(cursor, 2)],
+            [a.pk for a in self.F({}).page(None, 2)])
+
+
+class CountTest(TestCase):
+    fixtures = ['test_data']
+
+    class F(django_filters.FilterSet):
+        class Meta:
+            model = User
+            fields = ['username', 'status', 'favorite_books']
+            order_by = ['username']
+
+    def setUp(self):
+        cache.get_backend().clear()
+
+    def test_count(self):
+        f = self.F({'status': '1', 'o': 'username'})
+        expected = User.objects.filter(status=1).count()
+        with self.assertNumQueries(1):
+            self.assertEqual(f.count(), expected)
+            self.assertEqual(f.count(), expected)
+        self.assertTrue(f.exists())
+        self.assertFalse(self.F({'username': 'nobody'}).exists())
+
+        f = self.F({'status': '1'})
+        list(f.qs)
+        with self.assertNumQueries(0):
+            self.assertEqual(f.count(), len(f.qs))
+
+    def test_group_count(self):
+        group = FilterSetGroup(self.F, {'group-total-forms': '2',
+            '1-favorite_books': ['1', '2'], '2-username': 'jacob'})
+        self.assertEqual(group.count(), 3)
+        self.assertEqual(group.count(), len(group.qs))
+        self.assertTrue(group.exists())
+
+    def test_cached_count(self):
+        class F(self.F):
+            class Meta(self.F.Meta):
+                count_cache_timeout = 60
+        self.assertEqual(F({'status': '1'}).count(), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(F({'status': '1'}).count(), 1)
+            self.assertEqual(F({'status': '1', 'o': 'username'}).count(), 1)
+        self.assertEqual(F({'status': '0'}).count(), 2)
+        User.objects.create(username='zoe', status=1)
+        self.assertEqual(F({'status': '1'}).count(), 2)
+
+    def test_estimate(self):
+        class F(self.F):
+            class Meta(self.F.Meta):
+                count_cache_timeout = 60
+        estimate_count = query.estimate_count
+        query.estimate_count = lambda queryset: 1000
+        try:
+            f = F({'status': '0'})
+            self.assertEqual(f.count(estimate_above=100), 1000)
+            self.assertEqual(f.count(), 2)
+            self.assertEqual(F({'status': '0'}).count(estimate_above=1000), 2)
+            self.assertEqual(F({'status': '0'}).count(estimate_above=100), 1000)
+        finally:
+            query.estimate_count = estimate_count
+
+
+class FacetTest(TestCase):
+    fixtures = ['test_data']
+
+    class F(django_filters.FilterSet):
+        status = django_filters.ChoiceFilter(widget=LinkWidget,
+            choices=STATUS_CHOICES)
+        class Meta:
+            model = User
+            fields = ['status', 'is_active', 'favorite_books']
+            facets = ['status', 'is_active', 'favorite_books']
+
+    def setUp(self):
+        cache.get_backend().clear()
+
+    def test_facets(self):
+        self.assertEqual(self.F().facets(), {
+            'status': {0: 2, 1: 1},
+            'is_active': {False: 2, True: 1},
+            'favorite_books': {1: 2, 2: 1, 3: 1, None: 1},
+        })
+        # the counts of a facet ignore its own filter
+        f = self.F({'status': '0'})
+        with self.assertNumQueries(3):
+            self.assertEqual(f.facets(), {
+                'status': {0: 2, 1: 1},
+                'is_active': {False: 1, True: 1},
+                'favorite_books': {1: 1, 3: 1, None: 1},
+            })
+            f.facets()
+        self.assertEqual(f.get_facet_counts('is_active'), {u'2': 1, u'3': 1})
+
+    def test_multivalued(self):
+        f = self.F({'favorite_books': ['1', '2']})
+        self.assertEqual(f.facets()['status'], {0: 1, 1: 1})
+
+    def test_cached(self):
+        class F(self.F):
+            class Meta(self.F.Meta):
+                facet_cache_timeout = 60
+        F({'status': '1'}).facets()
+        with self.assertNumQueries(0):
+            self.assertEqual(F({'status': '1'}).facets()['is_active'], {False: 1})
+        User.objects.create(username='zoe', status=1, is_active=True)
+        self.assertEqual(F({'status': '1'}).facets()['is_active'],
+            {False: 1, True: 1})
+
+    def test_unknown_facet(self):
+        def define(lazy):
+            meta = type('Meta', (object,), {'model': User, 'fields': ['status'],
+                'facets': ['status', 'username'], 'lazy': lazy})
+            return type('F', (django_filters.FilterSet,), {'Meta': meta})
+        self.assertRaises(ImproperlyConfigured, define, False)
+        F = define(True)
+        try:
+            self.assertRaises(ImproperlyConfigured, F)
+        finally:
+            _lazy_classes.remove(F)
+
+    def test_link_widget(self):
+        html = unicode(self.F({'is_active': '2'}).form['status'])
+        self.assertTrue(u'>Regular (1)</a>' in html)
+        self.assertTrue(u'>Admin (0)</a>' in html)
+
+
+class LinkWidgetTest(TestCase):
+    choices = [('', '---------'), ('0', 'Regular'), ('1', u'Admin \xe9')]
+
+    def test_query_string(self):
+        w = LinkWidget(choices=self.choices)
+        w.value_from_datadict(QueryDict('status=1&page=2&tag=a&tag=b'), {}, 'status')
+        html = w.render('status', '1')
+        hrefs = re.findall(r'href="\?([^"]*)"', html)
+        self.assertEqual([sorted(QueryDict(href).lists()) for href in hrefs], [
+            [(u'page', [u'2']), (u'status', [value]), (u'tag', [u'a', u'b'])]
+            for value in (u'', u'0', u'1')])
+        self.assertEqual(re.findall(r'<a class="selected"[^>]*status=(\w*)"', html), [u'1'])
+
+    def test_dict_data(self):
+        w = LinkWidget(choices=[(u'\xe9', u'Accent')])
+        w.value_from_datadict({'status': u'\xe9', 'q': 'a b'}, {}, 'status')
+        self.assertEqual(w.render('status', u'\xe9'), u'<ul>\n'
+            u'<li><a class="selected" href="?q=a+b&status=%C3%A9">Accent</a></li>\n'
+            u'</ul>')
+
+    def test_iter_render(self):
+        w = LinkWidget(choices=self.choices)
+        lines = list(w.iter_render('status', None))
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(u'\n'.join(lines), w.render('status', None))
+        self.assertEqual(lines[1], u'<li><a class="selected" href="?status=">All</a></li>')
+
+
+class ResultCacheTest(TestCase):
+    fixtures = ['test_data']
+
+    class F(django_filters.FilterSet):
+        class Meta:
+            model = User
+            fields = ['status', 'favorite_books']
+            order_by = ['username', '-username']
+            result_cache_timeout = 60
+
+    def setUp(self):
+        cache.get_backend().clear()
+
+    def test_cached_results(self):
+        data = {'status': '0', 'o': '-username'}
+        self.assertEqual([u.username for u in self.F(data)], ['jacob', 'aaron'])
+        with self.assertNumQueries(1):
+            self.assertEqual([u.username for u in self.F(data)],
+                ['jacob', 'aaron'])
+        # the objects are fetched by primary key, the filters don't run again
+        User.objects.filter(username='jacob').update(status=1)
+        self.assertEqual([u.username for u in self.F(data)], ['jacob', 'aaron'])
+        # the key doesn't depend on the order of the values
+        self.assertEqual(self.F({'favorite_books': ['3', '2']}).get_state(),
+            self.F({'favorite_books': ['2', '3']}).get_state())
+
+    def test_extra_select(self):
+        class F(self.F):
+            status = django_filters.NumberFilter(action=lambda qs, value:
+                qs.filter(status=value).extra(select={'double': 'status * 2'}))
+        for i in range(2):
+            self.assertEqual([u.double for u in F({'status': '1'})], [2])
+        self.assertEqual(cache.get_backend().get(cache.make_key('results', User,
+            F({'status': '1'}).get_state()))[0], ['double'])
+
+    def test_lazy(self):
+        data = {'status': '0', 'o': 'username'}
+        list(self.F(data))
+        f = self.F(data)
+        with self.assertNumQueries(0):
+            f.qs
+        with self.assertNumQueries(1):
+            self.assertEqual(f.count(), 2)
+        with self.assertNumQueries(1):
+            self.assertEqual([u.username for u in f.qs[:1]], ['aaron'])
+
+    def test_max_rows(self):
+        class F(self.F):
+            class Meta(self.F.Meta):
+                result_cache_max_rows = 1
+        backend = cache.get_backend()
+        f = F({'status': '0'})
+        list(f)
+        self.assertEqual(backend.get(cache.make_key('results', User,
+            f.get_state())), None)
+        f = F({'status': '1'})
+        list(f)
+        self.assertEqual(backend.get(cache.make_key('results', User,
+            f.get_state())), ([], [(User.objects.get(username='alex').pk, ())]))
+
+    def test_invalidation(self):
+        data = {'status': '0', 'o': 'username'}
+        self.assertEqual(len(list(self.F(data))), 2)
+        User.objects.create(username='zoe', status=0)
+        self.assertEqual([u.username for u in self.F(data)],
+            ['aaron', 'jacob', 'zoe'])
+
+
+class CountingField(forms.CharField):
+    calls = 0
+
+    def clean(self, value):
+        CountingField.calls += 1
+        return super(CountingField, self).clean(value)
+
+
+class CountingFilter(django_filters.CharFilter):
+    field_class = CountingField
+
+
+class ValidationTest(TestCase):
+    fixtures = ['test_data']
+
+    def setUp(self):
+        CountingField.calls = 0
+
+    def test_single_pass(self):
+        class F(django_filters.FilterSet):
+            username = CountingFilter()
+            class Meta:
+                model = User
+                fields = ['username', 'status']
+                order_by = ['username']
+        f = F({'username': 'alex', 'o': 'username'})
+        self.assertEqual([u.username for u in f], ['alex'])
+        f.count()
+        f.get_state()
+        unicode(f.form)
+        self.assertEqual(CountingField.calls, 1)
+
+    def test_errors(self):
+        class F(django_filters.FilterSet):
+            class Meta:
+                model = User
+                fields = ['username', 'status']
+        f = F({'username': 'alex', 'status': 'x'})
+        self.assertEqual(f.errors.keys(), ['status'])
+        self.assertEqual(f.cleaned_data, {'username': u'alex'})
+        self.assertEqual([u.username for u in f], ['alex'])
+        self.assertEqual(F().errors, {})
+
+    def test_dynamic_form(self):
+        class F(django_filters.DynamicFilterSet):
+            username = CountingFilter()
+            class Meta:
+                model = User
+                fields = ['username']
+        f = F({'1-username': 'alex', '1-select_field': 'username'}, prefix='1')
+        self.assertEqual([u.username for u in f], ['alex'])
+        self.assertTrue(f.dynamic_form.is_valid())
+        self.assertEqual(f.dynamic_form.cleaned_data['username'], u'alex')
+        self.assertEqual(CountingField.calls, 1)
+
+
+class ExportTest(TestCase):
+    fixtures = ['test_data']
+
+    class F(django_filters.FilterSet):
+        class Meta:
+            model = User
+            fields = ['username', 'status', 'favorite_books']
+            order_by = ['username', '-username']
+
+    def export(self, data, **kwargs):
+        request = RequestFactory().get('/users/export/', data)
+        kwargs.setdefault('fields', ['username', 'status'])
+        response = object_export(request, filter_class=self.F, **kwargs)
+        return response, ''.join(response)
+
+    def test_csv(self):
+        response, content = self.export({'status': '0', 'o': '-username'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(content, 'username,status\r\njacob,0\r\naaron,0\r\n')
+        response, content = self.export({'username': 'nobody'})
+        self.assertEqual(content, 'username,status\r\n')
+
+    def test_ndjson(self):
+        response, content = self.export({'format': 'ndjson', 'o': 'username'},
+            chunk_size=2)
+        self.assertEqual([json.loads(line) for line in content.splitlines()], [
+            {'username': 'aaron', 'status': 0},
+            {'username': 'alex', 'status': 1},
+            {'username': 'jacob', 'status': 0},
+        ])
+        self.assertRaises(Http404, self.export, {'format': 'xml'})
+
+    def test_max_rows(self):
+        with self.assertNumQueries(2):
+            response, content = self.export({'o': 'username'}, max_rows=2,
+                chunk_size=1)
+        self.assertEqual(content, 'username,status\r\naaron,0\r\nalex,1\r\n')
+
+    def test_group(self):
+        response, content = self.export({'group-total-forms': '2',
+            '1-favorite_books': ['1', '2'], '2-username': 'jacob'}, group=True,
+            fields=['username'])
+        self.assertEqual(content, 'username\r\nalex\r\naaron\r\njacob\r\n')
+
+
+class ConcurrentTest(TestCase):
+    fixtures = ['test_data']
+
+    class F(django_filters.FilterSet):
+        username = django_filters.AllValuesFilter()
+        class Meta:
+            model = User
+            fields = ['username', 'status', 'is_active']
+            order_by = ['username']
+            facets = ['status']
+
+    def setUp(self):
+        # the threads share the connection to the in-memory test database
+        connection.allow_thread_sharing = True
+
+    def tearDown(self):
+        connection.allow_thread_sharing = False
+
+    def test_gather(self):
+        first, second = threading.Event(), threading.Event()
+        def wait(mine, other):
+            mine.set()
+            return other.wait(5)
+        self.assertEqual(concurrent.gather(lambda: wait(first, second),
+            lambda: wait(second, first)), [True, True])
+        self.assertRaises(ZeroDivisionError,
+            concurrent.Deferred(lambda: 1 / 0).result)
+
+    def test_deferred(self):
+        f = self.F({'status': '0', 'o': 'username'})
+        results, count, facets = f.aqs_list(), f.acount(), f.afacets()
+        self.assertEqual([u.username for u in results.result()], ['aaron', 'jacob'])
+        self.assertEqual(count.result(), 2)
+        self.assertEqual(facets.result(), {'status': {0: 2, 1: 1}})
+        self.assertEqual([u.username for u in f.aiter(1)], ['aaron', 'jacob'])
+
+        group = FilterSetGroup(self.F, {'group-total-forms': '2',
+            '1-status': '1', '2-username': 'jacob'})
+        self.assertEqual(group.acount().result(), 2)
+        self.assertEqual(sorted(u.username for u in group.aqs_list().result()),
+            ['alex', 'jacob'])
+
+    def test_prefetch_iterable(self):
+        threads = []
+        def items():
+            for i in range(3):
+                threads.append(threading.current_thread())
+                yield i
+        self.assertEqual(list(concurrent.prefetch(items())), [0, 1, 2])
+        self.assertEqual(len(set(threads)), 1)
+        self.assertNotEqual(threads[0], threading.current_thread())
+
+        iterator = concurrent.prefetch(items())
+        iterator.next()
+        iterator.close()
+        threads[-1].join(5)
+        self.assertFalse(threads[-1].is_alive())
+
+        def fail():
+            yield 1
+            raise ZeroDivisionError
+        self.assertRaises(ZeroDivisionError, list, concurrent.prefetch(fail()))
+
+    def test_prefetch(self):
+        f = self.F({'status': '0', 'o': 'username'})
+        f.prefetch(count=True, facets=True)
+        with self.assertNumQueries(0):
+            unicode(f.form)
+            self.assertEqual([u.username for u in f], ['aaron', 'jacob'])
+            self.assertEqual(f.count(), 2)
+            self.assertEqual(f.facets(), {'status': {0: 2, 1: 1}})
+
+
+class InstrumentationTest(TestCase):
+    fixtures = ['test_data']
+
+    class F(django_filters.FilterSet):
+        class Meta:
+            model = User
+            fields = ['username', 'status']
+
+    label = 'django_filters.tests.tests.F'
+
+    def test_collect(self):
+        self.assertEqual(self.F()._recorder, None)
+        with instrumentation.collect() as stats:
+            self.assertEqual(len(list(self.F({'status': '0'}))), 2)
+        keys = [(row['phase'], row['name'], row['calls'], row['rows'])
+            for row in stats.as_list()]
+        self.assertEqual(keys, [
+            ('compile', None, 1, 0),
+            ('execute', 'results', 1, 2),
+            ('filter', 'status', 1, 0),
+            ('filter', 'username', 1, 0),
+            ('form', None, 1, 0),
+            ('validation', None, 1, 0),
+        ])
+        self.assertTrue(all(row['filterset'] == self.label
+            for row in stats.as_list()))
+        self.assertTrue(stats.total('execute') > 0)
+
+    def test_signal(self):
+        events = []
+        def receiver(sender, **kwargs):
+            events.append(kwargs)
+        instrumentation.timing.connect(receiver)
+        try:
+            f = self.F({'username': 'alex'})
+            self.assertEqual(f.count(), 1)
+            list(f.qs)
+            group = FilterSetGroup(self.F, {'group-total-forms': '2',
+                '1-status': '1', '2-username': 'jacob'})
+            self.assertEqual(len(list(group)), 2)
+        finally:
+            instrumentation.timing.disconnect(receiver)
+        executed = [e for e in events if e['phase'] == 'execute']
+        self.assertEqual([(e['name'], e['rows']) for e in executed],
+            [('count', 1), ('results', 1), ('results', 2)])
+        self.assertTrue('"tests_user"."username" = %s' in executed[1]['sql'])
+        self.assertEqual(executed[1]['params'], ('alex',))
+        self.assertTrue(executed[2]['filterset'] is group)
+
+    def test_querysets(self):
+        with instrumentation.collect() as stats:
+            f = self.F({'status': '0'})
+            self.assertTrue(type(f.qs) is type(self.F().qs))
+            for user in f:
+                time.sleep(0.05)
+            data = pickle.dumps(f.qs)
+        # the time spent using the results isn't counted
+        self.assertTrue(stats.total('execute') < 0.05)
+        self.assertEqual(stats.data[self.label, 'compile', None][0], 1)
+        # pickled as a plain queryset, which other processes can load
+        self.assertFalse('Instrumented' in data)
+        qs = pickle.loads(data)
+        self.assertTrue(type(qs) is QuerySet)
+        self.assertEqual(sorted(u.username for u in qs), ['aaron', 'jacob'])
+        query = instrumentation.instrumented_class(instrumentation.InstrumentedQuery,
+            qs.query.__class__)
+        self.assertTrue(type(pickle.loads(pickle.dumps(qs.query.clone(klass=query))))
+            is type(qs.query))
+
+    def test_sampling(self):
+        with instrumentation.collect():
+            with self.settings(FILTERS_INSTRUMENTATION_SAMPLE_RATE=0):
+                self.assertEqual(self.F()._recorder, None)
+            self.assertNotEqual(self.F()._recorder, None)
+
+
+class UserIndexFilterSet(django_filters.FilterSet):
+    class Meta:
+        model = User
+        fields = ['username', 'favorite_books']
+
+
+class IndexAdvisorTest(TestCase):
+    class F(django_filters.FilterSet):
+        text = django_filters.CharFilter(lookup_type=['exact', 'icontains'])
+        author = django_filters.RelatedObjectFilter('author__username')
+        date = django_filters.DateRangeFilter()
+        class Meta:
+            model = Comment
+            fields = ['text', 'author', 'date']
+            order_by = ['date', '-date']
+
+    G = UserIndexFilterSet
+
+    class H(django_filters.FilterSet):
+        comments = django_filters.CharFilter(name='comment__text')
+        unknown = django_filters.CharFilter(name='comment__nothing')
+        status = django_filters.NumberFilter(
+            action=lambda qs, value: qs.filter(status=value))
+        class Meta:
+            model = User
+            fields = ['comments', 'unknown', 'status']
+
+    def get_entries(self, filterset_class, **kwargs):
+        return dict(((e['filter'], e['lookup']), e)
+            for e in indexes.advise(filterset_class, **kwargs))
+
+    def test_advise(self):
+        entries = self.get_entries(self.F)
+        self.assertEqual(sorted(entries), [('author', 'exact'),
+            ('date', 'gte'), ('date', 'lt'), ('o', 'order_by'),
+            ('text', 'exact'), ('text', 'icontains')])
+        author = entries['author', 'exact']
+        self.assertEqual((author['table'], author['column'], author['indexed']),
+            ('tests_user', 'username', False))
+        self.assertEqual(author['sql'],
+            'CREATE INDEX "tests_user_username" ON "tests_user" ("username");')
+        self.assertEqual(entries['text', 'icontains']['note'],
+            'no index serves icontains lookups on sqlite')
+        self.assertEqual(entries['text', 'icontains']['sql'], None)
+        self.assertEqual(entries['o', 'order_by']['path'], 'date')
+        self.assertEqual(sorted(indexes.suggestions(entries.values())), [
+            'CREATE INDEX "tests_comment_date" ON "tests_comment" ("date");',
+            'CREATE INDEX "tests_comment_text" ON "tests_comment" ("text");',
+            'CREATE INDEX "tests_user_username" ON "tests_user" ("username");',
+        ])
+
+    def test_existing_indexes(self):
+        entries = self.get_entries(self.G)
+        self.assertTrue(entries['favorite_books', 'in']['indexed'])
+        self.assertFalse(entries['username', 'exact']['indexed'])
+        connection.cursor().execute(
+            'CREATE INDEX "tests_user_username" ON "tests_user" ("username")')
+        self.assertTrue(self.get_entries(self.G)['username', 'exact']['indexed'])
+        self.assertFalse(self.get_entries(self.G,
+            introspect=False)['username', 'exact']['indexed'])
+
+    def test_unknown(self):
+        entries = self.get_entries(self.H)
+        self.assertEqual(sorted(entries), [('comments', 'exact'),
+            ('status', None), ('unknown', 'exact')])
+        self.assertFalse(entries['comments', 'exact']['indexed'])
+        self.assertEqual(entries['unknown', 'exact']['indexed'], None)
+        self.assertEqual(entries['status', None]['indexed'], None)
+        self.assertEqual(entries['status', None]['note'],
+            'custom filtering, the lookups are unknown')
+
+    def test_postgresql(self):
+        field = User._meta.get_field('username')
+        class Ops(object):
+            def quote_name(self, name):
+                return '"%s"' % name
+            def max_name_length(self):
+                return 63
+        class Connection(object):
+            vendor = 'postgresql'
+            ops = Ops()
+            creation = connection.creation
+        entry = {'table': 'tests_user', 'lookup': 'icontains'}
+        indexes._check(entry, 'itrigram', field, set(), Connection())
+        self.assertEqual(entry['sql'], 'CREATE INDEX "tests_user_username_upper_trgm" '
+            'ON "tests_user" USING gin (UPPER("username"::text) gin_trgm_ops);')
+        self.assertEqual(entry['requires'], 'CREATE EXTENSION IF NOT EXISTS pg_trgm;')
+        indexes._check(entry, 'itrigram', field,
+            set([('gin', 'upper((username)::text) gin_trgm_ops')]), Connection())
+        self.assertTrue(entry['indexed'])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('filter_indexes', 'django_filters.tests.tests.UserIndexFilterSet',
+            stdout=out)
+        self.assertEqual(out.getvalue(),
+            '-- django_filters.tests.tests.UserIndexFilterSet\n'
+            '--   username: username exact\n'
+            'CREATE INDEX "tests_user_username" ON "tests_user" ("username");\n')
+
+
+class UserSearchFilterSet(django_filters.FilterSet):
+    q = django_filters.SearchFilter(['username', 'first_name', 'last_name'])
+    class Meta:
+        model = User
+        fields = ['q', 'status']
+        order_by = ['username']
+
+
+class SearchFilterTest(TransactionTestCase):
+    # the FTS5 table is created inside the test, which commits on SQLite
+
+    F = UserSearchFilterSet
+
+    def setUp(self):
+        call_command('search_index', 'django_filters.tests.tests.UserSearchFilterSet',
+            stdout=StringIO())
+        for username, first_name, last_name, status in [
+            ('alex', 'Alex', 'Gaynor', 1),
+            ('jacob', 'Jacob', 'Kaplan-Moss', 0),
+            ('jake', 'Jacob', 'Jacob', 0),
+            ('aaron', 'Aaron', 'Jacobson', 0)]:
+            User.objects.create(username=username, first_name=first_name,
+                last_name=last_name, status=status)
+
+    def tearDown(self):
+        cursor = connection.cursor()
+        cursor.execute('DROP TABLE IF EXISTS "tests_user_username_first_name_last_name_fts"')
+        for name in ('insert', 'delete', 'update'):
+            cursor.execute('DROP TRIGGER IF EXISTS '
+                '"tests_user_username_first_name_last_name_fts_%s"' % name)
+
+    def usernames(self, filterset):
+        return [u.username for u in filterset.qs]
+
+    def test_search(self):
+        self.assertEqual(self.usernames(self.F({'q': 'jacob'})), ['jake', 'jacob'])
+        self.assertEqual(self.usernames(self.F({'q': 'JACOB moss'})), ['jacob'])
+        self.assertEqual(self.usernames(self.F({'q': '"jacob" OR'})), [])
+        self.assertEqual(self.usernames(self.F({'q': 'jacob', 'o': 'username'})),
+            ['jacob', 'jake'])
+        self.assertEqual(self.F({'q': 'jacob', 'status': '1'}).count(), 0)
+        self.assertEqual(len(self.usernames(self.F({'q': ' '}))), 4)
+
+    def test_sync(self):
+        self.assertEqual(self.usernames(self.F({'q': 'gaynor'})), ['alex'])
+        zoe = User.objects.create(username='zoe', last_name='Gaynor')
+        self.assertEqual(sorted(self.usernames(self.F({'q': 'gaynor'}))), ['alex', 'zoe'])
+        User.objects.filter(username='alex').update(last_name='Smith')
+        self.assertEqual(self.usernames(self.F({'q': 'gaynor'})), ['zoe'])
+        zoe.delete()
+        self.assertEqual(self.usernames(self.F({'q': 'gaynor'})), [])
+        self.assertEqual(self.usernames(self.F({'q': 'smith'})), ['alex'])
+
+    def test_group(self):
+        group = FilterSetGroup(self.F, {'group-total-forms': '2',
+            '1-q': 'kaplan', '2-q': 'gaynor'})
+        self.assertEqual(sorted(u.username for u in group.qs), ['alex', 'jacob'])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('search_index', 'django_filters.tests.tests.UserSearchFilterSet',
+            stdout=out)
+        self.assertEqual(out.getvalue(),
+            'django_filters.tests.tests.UserSearchFilterSet.q: already installed\n')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.usernames(self.F({'q': 'kaplan'})), ['jacob'])
+
+    def test_fallback_backend(self):
+        class F(self.F):
+            q = django_filters.SearchFilter(['username', 'last_name'],
+                backend=search.SearchBackend())
+        self.assertEqual(sorted(self.usernames(F({'q': 'jaco son'}))), ['aaron'])
+
+
 class AllValuesFilterTest(TestCase):
     fixtures = ['test_data']
 
@@ -91,6 +1371,55 @@ class AllValuesFilterTest(TestCase):
         self.assertEqual(list(F({'username': 'alex'})), [User.objects.get(username='alex')])
         self.assertEqual(list(F({'username': 'jose'})), list(User.objects.all()))
 
+class AllValuesFilterCacheTest(TestCase):
+    fixtures = ['test_data']
+
+    def setUp(self):
+        cache.get_backend().clear()
+
+    def test_cached_choices(self):
+        class F(django_filters.FilterSet):
+            username = django_filters.AllValuesFilter(cache_timeout=60)
+            class Meta:
+                model = User
+                fields = ['username']
+        unicode(F().form)
+        with self.assertNumQueries(0):
+            unicode(F().form)
+        # update() doesn't invalidate the cache
+        User.objects.filter(username='jacob').update(username='zoe')
+        self.assertFalse(u'zoe' in unicode(F().form))
+
+    def test_invalidation(self):
+        class F(django_filters.FilterSet):
+            username = django_filters.AllValuesFilter(cache_timeout=60,
+                invalidate=True)
+            class Meta:
+                model = User
+                fields = ['username']
+        self.assertFalse(u'zoe' in unicode(F().form))
+        User.objects.create(username='zoe', status=0)
+        self.assertTrue(u'zoe' in unicode(F().form))
+        User.objects.filter(username='zoe').delete()
+        self.assertFalse(u'zoe' in unicode(F().form))
+
+    def test_tracked_when_defined(self):
+        # processes that only write to the models invalidate the values too
+        class F(django_filters.FilterSet):
+            name = django_filters.AllValuesFilter(cache_timeout=60, invalidate=True)
+            class Meta:
+                model = Restaurant
+        class G(django_filters.FilterSet):
+            class Meta:
+                model = Book
+                count_cache_timeout = 60
+        generations = cache.get_generation(Restaurant), cache.get_generation(Book)
+        Restaurant.objects.create(name='Pizzeria', serves_pizza=True)
+        Book.objects.create(title='Dune', price='9', average_rating=4.5)
+        self.assertNotEqual(cache.get_generation(Restaurant), generations[0])
+        self.assertNotEqual(cache.get_generation(Book), generations[1])
+
+
 class InitialValueTest(TestCase):
     fixtures = ['test_data']
 
@@ -1,18 +1,36 @@
+import json
+
+from django.http import Http404, HttpResponse, HttpResponseNotModified
 from django.shortcuts import render_to_response
 from django.template import RequestContext
+from django.utils.cache import patch_vary_headers
+from django.utils.encoding import force_unicode
 
-from django_filters.filterset import FilterSet
+from django_filters import export, pagination
+from django_filters.fields import LookupTypeField
+from django_filters.filterset import FilterSet, FilterSetGroup
 
-def object_filter(request, model=None, queryset=None, template_name=None, extra_context=None,
-    context_processors=None, filter_class=None):
-    if model is None and filter_class is None:
-        raise TypeError("object_filter must be called with either model or filter_class")
+try:
+    from django.http import StreamingHttpResponse
+except ImportError:
+    # Before Django 1.5 a response built from an iterator is streamed as long
+    # as no middleware reads its content.
+    StreamingHttpResponse = HttpResponse
+
+def _get_filter_class(model, filter_class):
     if model is None:
         model = filter_class._meta.model
     if filter_class is None:
         meta = type('Meta', (object,), {'model': model})
         filter_class = type('%sFilterSet' % model._meta.object_name, (FilterSet,),
             {'Meta': meta})
+    return model, filter_class
+
+def object_filter(request, model=None, queryset=None, template_name=None, extra_context=None,
+    context_processors=None, filter_class=None):
+    if model is None and filter_class is None:
+        raise TypeError("object_filter must be called with either model or filter_class")
+    model, filter_class = _get_filter_class(model, filter_class)
     filterset = filter_class(request.GET or None, queryset=queryset)
 
     if not template_name:
@@ -26,3 +44,110 @@ def object_filter(request, model=None, queryset=None, template_name=None, extra_
                 v = v()
             c[k] = v
     return render_to_response(template_name, c)
+
+def object_choices(request, field_name, model=None, filter_class=None, page_size=20,
+    max_page_size=100):
+    """
+    Serves the choices of a model choice filter as JSON, for filters using
+    ``remote_url``.  The ``q`` parameter restricts the choices to the ones
+    whose ``search_field`` starts with it, ``after`` is the cursor returned
+    with the previous page and ``limit`` the number of choices per page.
+    """
+    if model is None and filter_class is None:
+        raise TypeError("object_choices must be called with either model or filter_class")
+    model, filter_class = _get_filter_class(model, filter_class)
+    filter_ = filter_class().filters.get(field_name)
+    if not getattr(filter_, 'remote_url', None):
+        # only the choices of filters loading them remotely are served
+        raise Http404
+    field = filter_.field
+    if isinstance(field, LookupTypeField):
+        field = field.fields[1]
+    if getattr(field, 'queryset', None) is None:
+        raise Http404
+    queryset = field.queryset
+
+    term = request.GET.get('q')
+    search_field = getattr(filter_, 'search_field', None)
+    if term and search_field:
+        queryset = queryset.filter(**{'%s__istartswith' % search_field: term})
+    after = request.GET.get('after')
+    if after:
+        try:
+            queryset = queryset.filter(pk__gt=after)
+        except ValueError:
+            raise Http404
+    try:
+        limit = min(max(int(request.GET.get('limit', page_size)), 1), max_page_size)
+    except ValueError:
+        limit = page_size
+
+    objs = list(queryset.order_by('pk')[:limit + 1])
+    data = {
+        'results': [{
+            'id': force_unicode(field.prepare_value(obj)),
+            'text': field.label_from_instance(obj),
+        } for obj in objs[:limit]],
+        'more': len(objs) > limit,
+    }
+    if data['more']:
+        data['after'] = force_unicode(objs[limit - 1].pk)
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+def filter_options(request, filter_class):
+    """
+    Serves the options of an unbound ``DynamicFilterSet`` as JSON, with an
+    ``ETag`` so clients can revalidate their copy.  The options depend on
+    the language of the request.
+    """
+    payload, etag = filter_class.get_options_json()
+    etag = '"%s"' % etag
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(payload, content_type='application/json')
+    response['ETag'] = etag
+    # the options are rendered in the active language
+    patch_vary_headers(response, ['Accept-Language'])
+    return response
+
+def _limit_rows(chunks, max_rows):
+    for rows in chunks:
+        rows = rows[:max_rows]
+        max_rows -= len(rows)
+        yield rows
+        if max_rows <= 0:
+            return
+
+def object_export(request, model=None, queryset=None, filter_class=None, fields=None,
+    format='csv', max_rows=None, chunk_size=1000, group=False):
+    """
+    Streams the results of a FilterSet, or of a ``FilterSetGroup`` of them with
+    ``group``, as CSV or newline delimited JSON.  ``fields`` are the columns
+    (all the fields of the model by default), ``format`` can be overridden
+    with the ``format`` parameter and ``max_rows`` caps the number of rows.
+    Rows are read ``chunk_size`` at a time with ``values_list()``.
+    """
+    if model is None and filter_class is None:
+        raise TypeError("object_export must be called with either model or filter_class")
+    model, filter_class = _get_filter_class(model, filter_class)
+    format = request.GET.get('format', format)
+    if format not in export.FORMATS:
+        raise Http404
+    if group:
+        filterset = FilterSetGroup(filter_class, request.GET, queryset=queryset)
+    else:
+        filterset = filter_class(request.GET or None, queryset=queryset)
+    if fields is None:
+        fields = [f.name for f in model._meta.fields]
+    if max_rows is not None:
+        chunk_size = min(chunk_size, max_rows)
+    chunks = pagination.iter_value_chunks(filterset.qs, filterset.get_ordering(),
+        fields, chunk_size)
+    if max_rows is not None:
+        chunks = _limit_rows(chunks, max_rows)
+    content_type, serialize = export.FORMATS[format]
+    response = StreamingHttpResponse(serialize(chunks, fields), content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename=%s.%s' % (
+        model._meta.object_name.lower(), format)
+    return response
@@ -1,14 +1,17 @@
 from itertools import chain
-from urllib import urlencode
+from urllib import quote_plus, urlencode
 
 from django import forms
 from django.db.models.fields import BLANK_CHOICE_DASH
 from django.forms.widgets import flatatt
-from django.utils.encoding import force_unicode
+from django.utils.encoding import force_unicode, smart_str
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext as _
 
 class LinkWidget(forms.Widget):
+    # the number of results for each choice, or a callable returning them
+    counts = None
+
     def __init__(self, attrs=None, choices=()):
         super(LinkWidget, self).__init__(attrs)
 
@@ -20,49 +23,118 @@ class LinkWidget(forms.Widget):
         return value
 
     def render(self, name, value, attrs=None, choices=()):
+        return mark_safe(u'\n'.join(self.iter_render(name, value, attrs, choices)))
+
+    def iter_render(self, name, value, attrs=None, choices=()):
+        """
+        Yields the lines of the rendered widget one by one, e.g. to stream
+        very long lists of choices.
+        """
         if not hasattr(self, 'data'):
             self.data = {}
         if value is None:
             value = ''
         final_attrs = self.build_attrs(attrs)
-        output = [u'<ul%s>' % flatatt(final_attrs)]
-        options = self.render_options(choices, [value], name)
-        if options:
-            output.append(options)
-        output.append('</ul>')
-        return mark_safe(u'\n'.join(output))
+        yield u'<ul%s>' % flatatt(final_attrs)
+        for option in self.iter_options(choices, [value], name):
+            yield option
+        yield u'</ul>'
 
     def render_options(self, choices, selected_choices, name):
+        return u'\n'.join(self.iter_options(choices, selected_choices, name))
+
+    def iter_options(self, choices, selected_choices, name):
         selected_choices = set(force_unicode(v) for v in selected_choices)
-        output = []
+        self.choice_counts = self.counts
+        if callable(self.choice_counts):
+            self.choice_counts = self.choice_counts()
+        # The other parameters of the query string are the same for every
+        # option, they are encoded once.
+        self.query_prefix = self.get_query_prefix(name)
         for option_value, option_label in chain(self.choices, choices):
             if isinstance(option_label, (list, tuple)):
                 for option in option_label:
-                    output.append(self.render_option(name, selected_choices, *option))
+                    yield self.render_option(name, selected_choices, *option)
             else:
-                output.append(self.render_option(name, selected_choices, option_value, option_label))
-        return u'\n'.join(output)
+                yield self.render_option(name, selected_choices, option_value, option_label)
+
+    def get_query_prefix(self, name):
+        """
+        Returns the encoded query string of the data without ``name``,
+        followed by ``name=``.
+        """
+        data = self.data
+        try:
+            data = data.copy()
+            data.pop(name, None)
+            query = data.urlencode()
+        except AttributeError:
+            query = urlencode([(key, value) for key, value in data.items()
+                if key != name])
+        if query:
+            query += '&'
+        return query + quote_plus(smart_str(name)) + '='
 
     def render_option(self, name, selected_choices, option_value, option_label):
         option_value = force_unicode(option_value)
         if option_label == BLANK_CHOICE_DASH[0][1]:
             option_label = _("All")
-        data = self.data.copy()
-        data[name] = option_value
-        selected = data == self.data or option_value in selected_choices
-        try:
-            url = data.urlencode()
-        except AttributeError:
-            url = urlencode(data)
+        elif getattr(self, 'choice_counts', None) is not None:
+            option_label = u'%s (%s)' % (force_unicode(option_label),
+                self.choice_counts.get(option_value, 0))
+        query_prefix = getattr(self, 'query_prefix', None)
+        if query_prefix is None:
+            query_prefix = self.get_query_prefix(name)
         return self.option_string() % {
-             'attrs': selected and ' class="selected"' or '',
-             'query_string': url,
+             'attrs': option_value in selected_choices and ' class="selected"' or '',
+             'query_string': query_prefix + quote_plus(smart_str(option_value)),
              'label': force_unicode(option_label)
         }
 
     def option_string(self):
         return '<li><a%(attrs)s href="?%(query_string)s">%(label)s</a></li>'
 
+def selected_model_choices(choices, values):
+    """
+    Returns the ``(value, label)`` pairs of a ``ModelChoiceIterator`` that are
+    in ``values``, fetched with a single query.
+    """
+    field = choices.field
+    output = []
+    if field.empty_label is not None:
+        output.append((u'', field.empty_label))
+    values = [v for v in values if v not in (None, u'')]
+    if values:
+        key = field.to_field_name or 'pk'
+        try:
+            objs = list(field.queryset.filter(**{'%s__in' % key: values}))
+        except ValueError:
+            objs = []
+        output.extend(choices.choice(obj) for obj in objs)
+    return output
+
+class RemoteSelect(forms.Select):
+    """
+    A ``Select`` for a ``ModelChoiceField`` that only renders the selected
+    option.  The other options are meant to be loaded on the client from
+    ``url``, see ``django_filters.views.object_choices``.
+    """
+    def __init__(self, url, attrs=None):
+        final_attrs = {'data-remote-url': url}
+        if attrs:
+            final_attrs.update(attrs)
+        super(RemoteSelect, self).__init__(final_attrs)
+
+    def render_options(self, choices, selected_choices):
+        selected_choices = set(force_unicode(v) for v in selected_choices)
+        output = []
+        for option_value, option_label in selected_model_choices(self.choices, selected_choices):
+            output.append(self.render_option(selected_choices, option_value, option_label))
+        return u'\n'.join(output)
+
+class RemoteSelectMultiple(RemoteSelect, forms.SelectMultiple):
+    pass
+
 class RangeWidget(forms.MultiWidget):
     def __init__(self, attrs=None):
         widgets = (forms.TextInput(attrs=attrs), forms.TextInput(attrs=attrs))